@@ -9,167 +9,28 @@ Author: Aleksandra Gruca (2026)
 Original: Joanna Ziemska-Legiecka (2025)
 """
 
-GO_ANNOTATIONS_FILE = "go_annotations.json"
-GO_NAMES_FILE ="go_names.csv"
 GO_MAX_PATH_FILE ="go_max_path.csv"
+QUICKGO_CACHE_FILE = "quickgo_cache.sqlite"
+DOWNLOAD_JOURNAL_FILE = "download_journal.jsonl"
+PERFORMANCE_REPORT_FILE = "performance_report_download.json"
 
 
-import logging
 import os
 import sys
-import time
-import typing
 import json
 from pathlib import Path
 from optparse import OptionParser
 
-import requests
-
-
-def fill_names(go_ids, save_file="/tmp/tmp_go.csv"):
-    for e, go_id in enumerate(list(go_ids)):
-        URL = f"https://www.ebi.ac.uk/QuickGO/services/ontology/go/search?query={go_id}"
-        print(URL, e, len(go_ids))
-        res = requests.get(URL)
-        for result in res.json()["results"]:
-            if result["id"] == go_id:
-                go_name = result['name']
-                aspect = result["aspect"]
-                print(go_id, (go_name, aspect))
-                with open(save_file, "a") as f:
-                    f.write(f"{go_id}\t{go_name}\t{aspect}\n")
-                break
-
-
-def get_GO(
-        protein_list: iter,
-        exclude: list,
-        #save_go_file: str,
-        aspect: str,
-        #lack_goes: str,
-) -> (typing.Dict, set):
-    aspect_dict = dict(F="molecular_function",
-                       P="biological_process",
-                       C="cellular_component")
-    result = {}
-    all_go = set()
-    e = 0
-    number_seq = "?"
-    
-    #protein_list = [i for i in protein_list]
-    begining = len(protein_list)
-    protein_go_dict = {}
-    while protein_list:
-        protein_run = protein_list[:100]
-        print(protein_run[0])
-        protein_list = protein_list[100:]
-        tries = 0
-        url = f"https://www.ebi.ac.uk/QuickGO/services/annotation/downloadSearch?geneProductId={','.join(protein_run)}"
-        header = dict(Accept='text/tsv')
-
-        logging.info(f"GO info downloaded for {protein_run} from {url} left {e}/{number_seq}")
-        req = requests.get(url, headers=header, timeout=10)
-        print(url, f"seq_no={e}", f"status_code={req.status_code}", f"tries={tries}")
-        e += 1
-        if req.status_code != 200:
-            print(req, protein_run)
-            print("err", req.status_code)
-            break
-        if not req.text.strip():
-            print("lack of content", req, protein_run)
-        for line in req.text.split("\n"):
-            new_line = line.split("\t")
-            if not line.startswith("GENE PRODUCT DB") and line.strip():
-                if new_line[1] in protein_run:
-                    protein_go = new_line[4]
-                    aspect_go = new_line[5]
-                    if aspect_go == aspect or aspect_go == aspect_dict.get(aspect):
-                        annotation_type_go = new_line[7]
-                        if annotation_type_go not in exclude:
-                            all_go.add(protein_go)
-                            if new_line[1] not in result:
-                                result[new_line[1]] = [protein_go]
-                            else:
-                                result[new_line[1]].append(protein_go)
-        for protein_acc in protein_run:
-            if protein_acc in result.keys():
-                #TO CLEAN
-                # logging.info(f"Save go in {save_go_file} data:{str(set(result[protein_acc]))} ")
-                #save_go(save_go_file, {protein_acc: set(result[protein_acc])}, mode="a")
-                protein_go_dict[protein_acc] = result[protein_acc]
-        #    else:
-        #        with open(lack_goes, "a") as f:
-        #            f.write(protein_acc + "\n")
-            if e % 1000 == 0:
-                logging.info(f"GO info taken from file for {protein_acc} left {e}/{number_seq}")
-            if not result.get(protein_acc):
-                result[protein_acc] = []
-        print(len([1 for i, j in result.items() if len(j) > 0]), len(protein_list), begining,
-              begining - len(protein_list))
-    return result, all_go, protein_go_dict
-
-
-def check_aspect(go, all_go, aspect):
-    aspect_dict = dict(F="molecular_function",
-                       P="biological_process",
-                       C="cellular_component")
-    # print(go, all_go)
-    if go is None:
-        return False
-    if go in all_go:
-        return True
-    else:
-        url = f"https://www.ebi.ac.uk/QuickGO/services/ontology/go/terms/{go}/"
-        request = requests.get(url, timeout=10)
-        request_json = request.json()
-        if request_json.get("results", {}):
-            aspect_go = [i for i in request_json["results"] if i["id"] == go][0]["aspect"]
-            if aspect_go == aspect or aspect_go == aspect_dict.get(aspect):
-                return True
-    return False
-
-
-def get_ancestors(
-        go_list: set,
-        #save_go_file: str,
-        ancestors_old: dict,
-        all_go: set,
-        aspect: str
-) -> (dict, set):
-    ancestors = {}
-    number_seq = len(go_list)
-    for e, go in enumerate(go_list):
-        if go not in ancestors_old:
-            url = f"https://www.ebi.ac.uk/QuickGO/services/ontology/go/terms/{go.replace(':', '%3A')}/ancestors?relations=is_a%2Cpart_of%2Coccurs_in%2Cregulates"
-            print(url)
-            print(f"GO ancestor info downloaded for {go} from {url} left {e}/{number_seq}")
-            tries = 0
-            success = False
-            while tries < 10 and not success:
-                try:
-                    request = requests.get(url, timeout=10)
-                    if request.status_code != 204:
-                        request_json = request.json()
-                        if request_json.get("results", {}):
-                            ancestors[go] = [i.get("ancestors") for i in request_json.get("results", {}) if
-                                             i["id"] == go and i.get("ancestors") is not None]
-                            ancestors[go] = [i for sublist in ancestors[go] for i in sublist if
-                                             i != go and check_aspect(i, all_go,
-                                                                      aspect)]
-
-                            all_go = all_go.union(set(ancestors[go]))
-                            #save_go(save_go_file, {go: ancestors[go]}, "a")
-                            success = True
-                    else:
-                        tries += 1
-                except Exception as err:
-                    print(err)
-                    tries += 1
-
-            if not success:
-                logging.info(f"Lack of GO ancestor info for {go} left {e}/{number_seq}")
-                ancestors[go] = []
-    return ancestors, all_go
+from src import annotations, performance
+from src.annotation_files import get_GO_from_file_aspects
+from src.annotation_store import is_annotation_store, iter_annotation_store
+from src.annotations import (crate_annotation_file, get_ancestors_aspects, get_GO_aspects, get_journaled_annotations,
+                             get_names, write_names)
+from src.downloader import QUICKGO_URL, QuickGOUnavailableError
+from src.http_cache import ResponseCache
+from src.journal import DownloadJournal
+from src.ontology import ALL_ASPECTS, ASPECT_DICT, read_obo
+from src.utils import GO_ANNOTATIONS_FILE, GO_ANNOTATIONS_STORE, GO_NAMES_FILE, get_aspect_dir
 
 
 def save_go(file: str,
@@ -217,61 +78,22 @@ def get_proteins(input_file_path):
         proteins = [line.strip() for line in f]
     return proteins
 
-def get_max_path(child: str, main_GO: str):
-    url_path = f"https://www.ebi.ac.uk/QuickGO/services/ontology/go/terms/{child}/paths/{main_GO}/"
-    req_path = requests.get(url_path)
-    if req_path:
-        max_path_len = 0
-        for result_path in req_path.json()["results"]:
-            if len(result_path) > max_path_len:
-                max_path_len = len(result_path)
-                return max_path_len
-        return max_path_len
-
-
-def get_paths(go: iter, path_path: str, aspect: str):
-    aspect_dict = dict(F="GO:0003674",
-                       molecular_function="GO:0003674",
-                       P="GO:0008150",
-                       biological_process="GO:0008150",
-                       C="GO:0005575",
-                       cellular_component="GO:0005575")
-    with open(path_path, "w") as f:
-        for go_id in go:
-            path_len = get_max_path(go_id, aspect_dict[aspect])
-            f.write(f"{go_id}\t{path_len}\n")
-
-def add_ancestors(
-        ancestors: dict,
-        go_protein: dict
-) -> dict:
-    for e, protein in enumerate(go_protein.keys()):
-        if e % 1000 == 0:
-            logging.info(f"Add ancestors to {protein} {e}/{len(go_protein.keys())}")
-        for old_go, anc in ancestors.items():
-            if old_go in go_protein[protein]:
-                go_protein[protein] += anc
-                go_protein[protein] = list(set(go_protein[protein]))
-    return go_protein
-
-
-#old prepare_data function from go_analyse.py
-def crate_annotation_file(all_go, ancestors, ouput_annotation_file):
-    
-    logging.info(f"Add ancestors info to protein GO")    
-    all_go = add_ancestors(ancestors, all_go)
-
 
-    with open(ouput_annotation_file, 'w', encoding='utf-8') as f:
-        json.dump(all_go, f, indent=4, ensure_ascii=False)
-
-
-def prepare_folders(input_file, exclude_IEA, ouptput_dir):
+def prepare_folders(input_file, exclude_IEA, ouptput_dir, ontology_file=None, annotation_file=None,
+                    keep_names=False):
 
     #check if input file with proteins exists
     if not os.path.isfile(input_file):
         sys.exit("Input file with protein IDs does not exists. Exiting...")
 
+    #check if GO ontology file exists
+    if ontology_file and not os.path.isfile(ontology_file):
+        sys.exit("GO ontology file does not exists. Exiting...")
+
+    #check if GO annotation file exists
+    if annotation_file and not os.path.isfile(annotation_file):
+        sys.exit("GO annotation file does not exists. Exiting...")
+
     #create output directory    
     os.makedirs(ouptput_dir, exist_ok=True)
     
@@ -284,7 +106,7 @@ def prepare_folders(input_file, exclude_IEA, ouptput_dir):
     #path.touch()  
 
     go_names_file_path = os.path.join(ouptput_dir, GO_NAMES_FILE)
-    if os.path.exists(go_names_file_path):
+    if os.path.exists(go_names_file_path) and not keep_names:
         os.remove(go_names_file_path)
     path = Path(go_names_file_path)
     path.touch()
@@ -306,31 +128,150 @@ def prepare_folders(input_file, exclude_IEA, ouptput_dir):
 
     return go_names_file_path, go_annotations_file_path, exclude_IEA
 
+def read_existing_outputs(go_annotations_file_path, go_names_file_path, go_annotations_store_path):
+    existing_annotations = {}
+    if os.path.exists(go_annotations_file_path):
+        with open(go_annotations_file_path, 'r', encoding='utf-8') as f:
+            existing_annotations = json.load(f)
+    elif is_annotation_store(go_annotations_store_path):
+        existing_annotations = dict(iter_annotation_store(go_annotations_store_path))
+    existing_names = set()
+    with open(go_names_file_path) as f:
+        for line in f:
+            if line.strip():
+                existing_names.add(line.split("\t")[0])
+    return existing_annotations, existing_names
+
+
 def main(options):
-    
-    [go_names_file_path, go_annotations_file_path, exclude_IEA] = \
-        prepare_folders(options.input, options.exclude_IEA, options.output_dir)
-    
-    proteins = get_proteins(options.input)    
 
-    proteins_go, all_go, protein_go_dict = get_GO(protein_list=proteins,
-                                 exclude=exclude_IEA,
-                                 aspect=options.aspect)
-                                 #lack_goes=lack_go_file_path)
+    report = performance.start_report("download")
+    report.add_rate("proteins_per_second", "downloaded_proteins", "download")
 
-    ancestors, all_go = get_ancestors(set([item for sublist in list(proteins_go.values()) for item in sublist]),
-                                      ancestors_old={},
-                                      all_go=all_go,
-                                      aspect=options.aspect)
+    #with --aspect=all annotations of every aspect come from one download and are written to its own subdirectory
+    if options.aspect == ALL_ASPECTS:
+        aspect_dirs = {aspect: get_aspect_dir(options.output_dir, aspect) for aspect in ASPECT_DICT}
+    else:
+        aspect_dirs = {options.aspect: options.output_dir}
+
+    go_names_file_paths, go_annotations_file_paths = {}, {}
+    for aspect, aspect_dir in aspect_dirs.items():
+        [go_names_file_paths[aspect], go_annotations_file_paths[aspect], exclude_IEA] = \
+            prepare_folders(options.input, options.exclude_IEA, aspect_dir,
+                            options.ontology_file, options.annotation_file, keep_names=options.update)
+
+    #cache and journal are used by all QuickGO requests of src.annotations
+    response_cache = None
+    if not options.no_cache:
+        cache_file = options.cache_file or os.path.join(options.output_dir, QUICKGO_CACHE_FILE)
+        response_cache = ResponseCache(cache_file,
+                                       ttl=options.cache_ttl * 24 * 3600,
+                                       max_size=options.cache_max_size * 1024 ** 2)
+    annotations.response_cache = response_cache
+    
+    go_annotations_store_paths = {aspect: os.path.join(aspect_dir, GO_ANNOTATIONS_STORE)
+                                  for aspect, aspect_dir in aspect_dirs.items()}
+
+    download_journal = DownloadJournal(os.path.join(options.output_dir, DOWNLOAD_JOURNAL_FILE),
+                                       settings=dict(aspect=options.aspect, exclude=exclude_IEA),
+                                       resume=options.resume or options.update)
+    annotations.download_journal = download_journal
+
+    with performance.stage("protein list"):
+        proteins = get_proteins(options.input)
+
+    #in update mode only proteins and GO terms missing from output directory are downloaded
+    existing_annotations = {aspect: {} for aspect in aspect_dirs}
+    existing_names = {aspect: set() for aspect in aspect_dirs}
+    if options.update:
+        for aspect in aspect_dirs:
+            existing_annotations[aspect], existing_names[aspect] = read_existing_outputs(
+                go_annotations_file_paths[aspect], go_names_file_paths[aspect], go_annotations_store_paths[aspect])
+    proteins = [i for i in proteins if not any(i in existing for existing in existing_annotations.values())]
+    new_proteins = [i for i in proteins if i not in download_journal.annotations]
+    print(f"{len(new_proteins)} of {len(proteins)} proteins to download")
+    performance.count("proteins", len(proteins))
+    performance.count("downloaded_proteins", len(new_proteins))
+
+    with performance.stage("ontology"):
+        ontology = read_obo(options.ontology_file) if options.ontology_file else None
+
+    with performance.stage("download"):
+        if options.annotation_file:
+            #annotations streamed from local GAF/GPAD file instead of QuickGO
+            aspect_results = get_GO_from_file_aspects(options.annotation_file,
+                                                      protein_list=new_proteins,
+                                                      exclude=exclude_IEA,
+                                                      aspects=aspect_dirs,
+                                                      ontology=ontology)
+            annotations.journal_annotations({aspect: proteins_go for aspect, (proteins_go, all_go, protein_go_dict)
+                                             in aspect_results.items()}, new_proteins)
+        else:
+            aspect_results = get_GO_aspects(protein_list=new_proteins,
+                                         exclude=exclude_IEA,
+                                         aspects=aspect_dirs,
+                                         workers=options.download_workers,
+                                         requests_per_second=options.requests_per_second,
+                                         max_retries=options.max_retries,
+                                         base_url=options.quickgo_url)
+                                         #lack_goes=lack_go_file_path)
+
+    go_lists, all_gos = {}, {}
+    for aspect, (proteins_go, all_go, protein_go_dict) in aspect_results.items():
+        #proteins downloaded in previous runs are taken from journal
+        for protein_acc in proteins:
+            if protein_acc not in proteins_go and protein_acc in download_journal.annotations:
+                proteins_go[protein_acc] = get_journaled_annotations(protein_acc, aspect)
+                if proteins_go[protein_acc]:
+                    protein_go_dict[protein_acc] = proteins_go[protein_acc]
+                    all_go.update(proteins_go[protein_acc])
+
+        go_lists[aspect] = set([item for sublist in list(proteins_go.values()) for item in sublist])
+        all_gos[aspect] = all_go
+        performance.count("go_terms", len(go_lists[aspect]))
+
+    if ontology is not None:
+        #ancestors, aspects and names taken from local OBO file instead of QuickGO
+        with performance.stage("ancestors"):
+            aspect_ancestors = {aspect: ontology.get_ancestors_for_aspect(go_lists[aspect], all_go=all_gos[aspect],
+                                                                          aspect=aspect)
+                                for aspect in aspect_dirs}
+        with performance.stage("names"):
+            for aspect, (ancestors, all_go) in aspect_ancestors.items():
+                ontology.save_names(all_go - existing_names[aspect], save_file=go_names_file_paths[aspect])
+    else:
+        #ancestors and names of all aspects are downloaded together
+        with performance.stage("ancestors"):
+            aspect_ancestors = get_ancestors_aspects(go_lists, all_gos, base_url=options.quickgo_url)
 
-    #create file with names of GO terms
-    fill_names(all_go, save_file=go_names_file_path)
+        #create file with names of GO terms
+        with performance.stage("names"):
+            new_names = {aspect: all_go - existing_names[aspect] for aspect, (ancestors, all_go) in aspect_ancestors.items()}
+            terms = get_names(set().union(*new_names.values()), base_url=options.quickgo_url)
+            for aspect, go_ids in new_names.items():
+                write_names(go_ids, terms, save_file=go_names_file_paths[aspect])
 
     #create file with max paths of GO terms
     #get_paths(all_go, path_path=go_max_path_file_path, aspect=options.aspect)
 
-    #create json file with GO protein GO annotations including ancestors
-    crate_annotation_file(protein_go_dict, ancestors, go_annotations_file_path)
+    #create json file and/or binary store with GO protein GO annotations including ancestors
+    with performance.stage("annotation write"):
+        for aspect, (proteins_go, all_go, protein_go_dict) in aspect_results.items():
+            ancestors, all_go = aspect_ancestors[aspect]
+            crate_annotation_file(protein_go_dict, ancestors, go_annotations_file_paths[aspect],
+                                  existing_annotations[aspect],
+                                  annotation_store=go_annotations_store_paths[aspect]
+                                  if options.annotation_format != "json" else None,
+                                  write_json=options.annotation_format != "store")
+
+    download_journal.close()
+    if response_cache is not None:
+        print(response_cache.report())
+        response_cache.close()
+
+    report_file = options.performance_report or os.path.join(options.output_dir, PERFORMANCE_REPORT_FILE)
+    report.save(report_file)
+    print(f"Performance report saved to {report_file}")
 
 
 def get_options():
@@ -340,9 +281,48 @@ def get_options():
     parser.add_option("-e", "--exclude_IEA", dest="exclude_IEA", default="no",
                       help="Exclude GO terms with IEA? yes/no", metavar="STRING")
     parser.add_option("-s", "--aspect", dest="aspect", default="F",
-                      help="Aspect of GO", metavar="STRING")
+                      help=f"Aspect of GO: F, P, C or {ALL_ASPECTS} - all three aspects from one download, "
+                           f"files of every aspect are written to its subdirectory of output directory (e.g. F/)",
+                      metavar="STRING")
     parser.add_option('-o', '--output_dir', default='./gbsc_functional_results/', 
                       help='Project directory')
+    parser.add_option("-g", "--ontology_file", dest="ontology_file", default=None,
+                      help="Local GO ontology OBO file (e.g. go-basic.obo) used instead of QuickGO for ancestors, aspects and names",
+                      metavar="OBO")
+    parser.add_option("-f", "--annotation_file", dest="annotation_file", default=None,
+                      help="Local GAF or GPAD annotation file, may be gzipped, used instead of QuickGO download. "
+                           "GPAD files require --ontology_file",
+                      metavar="FILE")
+    parser.add_option("--annotation_format", dest="annotation_format", default="both",
+                      type="choice", choices=["json", "store", "both"],
+                      help=f"Write annotations as {GO_ANNOTATIONS_FILE}, binary {GO_ANNOTATIONS_STORE} or both",
+                      metavar="json/store/both")
+    parser.add_option("--quickgo_url", dest="quickgo_url", default=QUICKGO_URL,
+                      help="Base URL of QuickGO services", metavar="URL")
+    parser.add_option("--download_workers", dest="download_workers", default=4, type="int",
+                      help="Number of concurrent QuickGO annotation requests", metavar="INT")
+    parser.add_option("--requests_per_second", dest="requests_per_second", default=10, type="float",
+                      help="Limit of QuickGO annotation requests per second, 0 - no limit", metavar="FLOAT")
+    parser.add_option("--max_retries", dest="max_retries", default=5, type="int",
+                      help="Retries of failed QuickGO request before the batch is split", metavar="INT")
+    parser.add_option("--cache_file", dest="cache_file", default=None,
+                      help=f"SQLite cache of QuickGO responses (default: {QUICKGO_CACHE_FILE} in output directory)",
+                      metavar="FILE")
+    parser.add_option("--cache_ttl", dest="cache_ttl", default=30, type="float",
+                      help="Days after which cached QuickGO responses are downloaded again", metavar="DAYS")
+    parser.add_option("--cache_max_size", dest="cache_max_size", default=1024, type="float",
+                      help="Maximum size of QuickGO cache, least recently used responses are removed",
+                      metavar="MB")
+    parser.add_option("--resume", dest="resume", action="store_true", default=False,
+                      help=f"Continue interrupted run, data saved in {DOWNLOAD_JOURNAL_FILE} is not downloaded again")
+    parser.add_option("--update", dest="update", action="store_true", default=False,
+                      help="Download only proteins and GO terms missing from existing output directory "
+                           "and merge them into its annotation and GO names files")
+    parser.add_option("--performance_report", dest="performance_report", default=None,
+                      help=f"JSON file with stage timings, QuickGO request counts and latencies and peak memory "
+                           f"of the run (default: {PERFORMANCE_REPORT_FILE} in output directory)", metavar="FILE")
+    parser.add_option("--no_cache", dest="no_cache", action="store_true", default=False,
+                      help="Do not use QuickGO responses cache")
     options, args = parser.parse_args()
 
     return options, args
@@ -351,4 +331,8 @@ def get_options():
 if __name__ == "__main__":
     # try:
     options, args = get_options()
-    main(options)
+    try:
+        main(options)
+    except QuickGOUnavailableError as e:
+        sys.exit(f"Exiting....\n {e} \
+                 \n Completed batches are kept in download journal, run again with --resume when QuickGO is available")
@@ -9,18 +9,25 @@ Author: Aleksandra Gruca (2026)
 Original: Joanna Ziemska-Legiecka (2025)
 """
 
-GO_ANNOTATIONS_FILE = "go_annotations.json"
-ENRICHMENT_RESULTS_FILE="enrichment_results.csv"
-GO_NAMES_FILE ="go_names.csv"
+RESULT_CACHE_FILE = "cluster_results_cache.sqlite"
+PERFORMANCE_REPORT_FILE = "performance_report_analysis.json"
+SWEEP_S_VALUES_FILE = "clusters_s_values_alpha{alpha}.txt"
+SWEEP_SETTINGS_FILE = "sweep_settings.tsv"
 
 
 import os
 import sys
 import logging
-from src.analyse_clusters import AnaliseCluster
+import importlib.util
+from src import performance
+from src.analyse_clusters import AnaliseCluster, SMeasureSink
+from src.result_cache import ClusterResultCache
+from src.shards import Shard, merge_shards
 from optparse import OptionParser
-from src.go_analise import run_go_analyse
-from src.utils import get_all_gbsc_proteins
+from src.go_analise import RESULT_FORMATS, AnnotationIndex, MultiSink, SweepSink, open_result_sink, run_go_analyse
+from src.ontology import ALL_ASPECTS, ASPECT_DICT
+from src.utils import (ENRICHMENT_RESULTS_FILES, GO_NAMES_FILE, S_VALUES_FILE, get_all_gbsc_proteins,
+                       get_annotations_file, get_aspect_dir, read_clusters)
 from pathlib import Path
 
 
@@ -36,69 +43,335 @@ def check_folders(options):
             \n Run 01_download_go.py script first or check the path to project directory")
     
     gbsc_clusters_path = options.gbsc_clusters
-    #check if GSBSC clusters directory path exists
-    if not os.path.isdir(gbsc_clusters_path):
+    #check if GSBSC clusters directory (or tar archive / multi-cluster FASTA file) path exists
+    if gbsc_clusters_path is None or not os.path.exists(gbsc_clusters_path):
         sys.exit("Path to the directory with GBSC clusters does not exists. Exiting...")
     
     #check if GSBSC clusters directory path is not empty
-    if not os.listdir(gbsc_clusters_path):
+    if os.path.isdir(gbsc_clusters_path) and not os.listdir(gbsc_clusters_path):
         sys.exit("Directory with GBSC clusters is empty. Exiting...")
 
+    #columnar results formats need optional pyarrow package
+    if options.results_format != "tsv" and importlib.util.find_spec("pyarrow") is None:
+        sys.exit(f"Exiting....\n Results format {options.results_format} requires pyarrow package. \
+                 \n Install it with pip install pyarrow or use --results_format=tsv")
+
+    #clusters of shard are tested with per-cluster correction, all shards are combined with --merge
+    if options.shard:
+        try:
+            options.shard = Shard.parse(options.shard)
+        except ValueError as e:
+            sys.exit(f"Exiting....\n {e}")
+        if options.correction == "global" or options.sweep_alphas or options.sweep_annotations:
+            sys.exit("Exiting....\n --shard can not be used with --correction=global or parameter sweep")
+
+    aspect_dirs = get_aspect_dirs(options)
+
+    #parameter sweep: annotations of other runs of 01_download_go.py (e.g. without IEA) are analysed as well
+    if options.sweep_annotations:
+        for sweep_dir in options.sweep_annotations.split(","):
+            if not os.path.isdir(sweep_dir):
+                sys.exit(f"Exiting....\n Sweep annotations directory {sweep_dir} does not exist.")
+            aspect_dirs[sweep_dir] = sweep_dir
+
+    aspect_files = {}
+    for aspect, aspect_dir in aspect_dirs.items():
+        aspect_files[aspect] = (aspect_dir, *check_aspect_folder(aspect_dir, options.results_format))
+
+    if options.sweep_alphas:
+        try:
+            options.sweep_alphas = list(dict.fromkeys(float(alpha) for alpha in options.sweep_alphas.split(",")))
+        except ValueError:
+            sys.exit(f"Exiting....\n Sweep alphas {options.sweep_alphas} should be comma separated numbers.")
+    elif options.sweep_annotations:
+        options.sweep_alphas = [options.alpha]
+    
+    return gbsc_clusters_path, aspect_files
+
+def get_aspect_dirs(options):
+    #with --aspect files of every aspect are in its subdirectory written by 01_download_go.py --aspect=all
+    if options.aspect is None:
+        return {None: options.ouput_dir}
+    aspects = ASPECT_DICT if options.aspect == ALL_ASPECTS else [options.aspect]
+    return {aspect: get_aspect_dir(options.ouput_dir, aspect) for aspect in aspects}
+
+def check_aspect_folder(ouput_dir, results_format):
+
     #dictuionary file with mapping GO IDs to GO names
     go_names_file_path = os.path.join(ouput_dir, GO_NAMES_FILE)
     if not os.path.exists(go_names_file_path):
         sys.exit(f"Exiting....\n File {go_names_file_path} does not exist. \
                  \n Run 01_download_go.py script first or check the path to project directory")
 
-    #file with GO annotations - result of 01_download_go.py
-    go_annotations_file_path = os.path.join(ouput_dir, GO_ANNOTATIONS_FILE)
+    #file with GO annotations - result of 01_download_go.py, binary store or JSON file
+    go_annotations_file_path = get_annotations_file(ouput_dir)
     if not os.path.exists(go_annotations_file_path):
          sys.exit(f"Exiting....\n File {go_annotations_file_path} does not exist. \
                  \n Run 01_download_go.py script first or check the path to project directory")  
 
-
-    enrichment_results_file_path = os.path.join(ouput_dir, ENRICHMENT_RESULTS_FILE)
-    with open(enrichment_results_file_path, "w") as f:
-        f.write(f"GBSC cluster\tGO ID\tp-value\tAll proteins\tAll proteins annotated with GO\
-                \tCluster size\tProteins annotated with GO in cluster\tBonferroni corrected p-value\tBonferroni significance results alpha={options.alpha}\tBenjamini-Hochberg corrected p-value\tBenjamini-Hochberg significance results alpha={options.alpha}\n")
+    enrichment_results_file_path = os.path.join(ouput_dir, ENRICHMENT_RESULTS_FILES[results_format])
     
-    return go_annotations_file_path, gbsc_clusters_path, go_names_file_path, enrichment_results_file_path
+    return go_annotations_file_path, go_names_file_path, enrichment_results_file_path
 
 def main(options, args):
     
     file_handler = logging.FileHandler(options.log_file, mode='w', encoding='utf-8')
     logger.addHandler(file_handler)
+    if options.debug:
+        logger.setLevel(logging.DEBUG)
+
+    if options.merge:
+        merge(options)
+        return
+
+    if options.smeasure_only:
+        smeasure(options)
+        return
+
+    report = performance.start_report("analysis")
+    report.add_rate("tests_per_second", "tests", "enrichment")
+    report.add_rate("clusters_per_second", "clusters", "enrichment")
 
     #check if requierd files with GO annotations exists
-    [go_annotations_file_path, gbsc_clusters_path, go_names_file_path, enrichment_results_file_path] = check_folders(options)
+    [gbsc_clusters_path, aspect_files] = check_folders(options)
 
     #helper function to get all GBSC protein IDs for test set for 01_download_go.py  
     # get_all_gbsc_proteins(gbsc_clusters_path)
 
-    run_go_analyse(enrichment_results_file_path, go_annotations_file_path, options.alpha, gbsc_clusters_path)
+    #shard keeps its cache and performance report in its own directory
+    run_dir = options.shard.get_dir(options.ouput_dir) if options.shard else options.ouput_dir
+    os.makedirs(run_dir, exist_ok=True)
 
-    print(f"Estimation results saved to {enrichment_results_file_path}")     
-    
-    analyse_cluster = AnaliseCluster(enrichment_results_file_path, "0")
-    analyse_cluster.read_enrichment_results()
-    analyse_cluster.count_c()
+    #cluster results cache is opt-in, with --use_result_cache or --result_cache file
+    result_cache = None
+    if (options.use_result_cache or options.result_cache) and not options.no_result_cache:
+        result_cache = ClusterResultCache(options.result_cache or os.path.join(run_dir, RESULT_CACHE_FILE),
+                                          max_size=options.result_cache_max_size * 1024 ** 2)
+
+    #clusters are parsed once and tested with annotations of every aspect
+    #(a shard reads only its own cluster files)
+    clusters = gbsc_clusters_path
+    if len(aspect_files) > 1 and not options.shard:
+        with performance.stage("cluster parsing"):
+            clusters = read_clusters(gbsc_clusters_path)
 
-    s_values_file = os.path.join(options.ouput_dir, "clusters_s_values.txt") 
-    analyse_cluster.save(s_values_file, go_names_file_path)
+    if options.sweep_alphas:
+        run_sweep(options, aspect_files, clusters, result_cache)
+    else:
+        run_analysis(options, aspect_files, clusters, result_cache)
 
-    print(f"s-measure results for GBSC clusters saved to {s_values_file}")     
+    if options.tarone and not options.sweep_alphas:
+        print(f"Untestable GO terms pruned: {report.counters.get('pruned_tests', 0)} "
+              f"of {report.counters.get('pruned_tests', 0) + report.counters.get('tests', 0)} tests")
+
+    tail_cache_hits = report.counters.get("tail_cache_hits", 0)
+    tail_cache_tests = tail_cache_hits + report.counters.get("tail_cache_misses", 0)
+    if tail_cache_tests:
+        print(f"Hypergeometric tail cache: hits={tail_cache_hits} misses={tail_cache_tests - tail_cache_hits} "
+              f"hit_rate={tail_cache_hits / tail_cache_tests:.2%}")
+
+    if result_cache is not None:
+        print(result_cache.report())
+        result_cache.close()
+
+    report_file = options.performance_report or os.path.join(run_dir, PERFORMANCE_REPORT_FILE)
+    report.save(report_file)
+    print(f"Performance report saved to {report_file}")     
 
     
+def run_analysis(options, aspect_files, clusters, result_cache):
+
+    for aspect, (aspect_dir, go_annotations_file_path, go_names_file_path, enrichment_results_file_path) \
+            in aspect_files.items():
+        if aspect is not None:
+            print(f"GO aspect {aspect}: {aspect_dir}")
+
+        #results of shard are written to its directory, annotations version is saved in its manifest
+        go_annotations = go_annotations_file_path
+        if options.shard:
+            aspect_dir = options.shard.get_dir(aspect_dir)
+            os.makedirs(aspect_dir, exist_ok=True)
+            enrichment_results_file_path = os.path.join(aspect_dir, os.path.basename(enrichment_results_file_path))
+            with performance.stage("annotation load"):
+                go_annotations = AnnotationIndex.load(go_annotations_file_path)
+            print(f"Shard {options.shard}: results are written to {aspect_dir}")
+
+        #s-measure is computed from results while clusters are tested, results file is optional
+        s_values_file = os.path.join(aspect_dir, S_VALUES_FILE)
+        analyse_cluster = AnaliseCluster(enrichment_results_file_path, "0")
+        result_sinks = [SMeasureSink(analyse_cluster, s_values_file)]
+        if not options.no_results_file:
+            result_sinks.insert(0, open_result_sink(enrichment_results_file_path, options.alpha,
+                                                    options.results_format, options.significant_only))
+
+        with performance.stage("enrichment"):
+            run_go_analyse(MultiSink(result_sinks), go_annotations, options.alpha, clusters,
+                           workers=options.workers, result_cache=result_cache, correction=options.correction,
+                           tail_cache_size=options.tail_cache_size, tarone=options.tarone, shard=options.shard)
+
+        if not options.no_results_file:
+            print(f"Estimation results saved to {enrichment_results_file_path}")
+
+        with performance.stage("s-measure"):
+            analyse_cluster.count_c()
+            analyse_cluster.save(s_values_file, go_names_file_path)
+
+        print(f"s-measure results for GBSC clusters saved to {s_values_file}")
+
+        if options.shard:
+            settings = dict(alpha=options.alpha, correction=options.correction, tarone=options.tarone,
+                            results_format=options.results_format, significant_only=options.significant_only,
+                            annotations_version=go_annotations.version)
+            files = dict(results=None if options.no_results_file else os.path.basename(enrichment_results_file_path),
+                         s_values=S_VALUES_FILE)
+            options.shard.write_manifest(aspect_dir, settings, files)
+            print(f"Shard {options.shard}: {len(options.shard.clusters)} of {options.shard.clusters_total} "
+                  f"clusters tested")
+
+
+def merge(options):
+
+    #results of all shards of --shard i/N runs are combined into files of unsharded run
+    if not os.path.isdir(options.ouput_dir):
+        sys.exit(f"Exiting....\n Project output directory {options.ouput_dir} does not exist.")
+    for aspect, aspect_dir in get_aspect_dirs(options).items():
+        try:
+            merged = merge_shards(aspect_dir)
+        except ValueError as e:
+            sys.exit(f"Exiting....\n Shards in {aspect_dir} can not be merged: {e}")
+        if merged["files"]["results"]:
+            print(f"Estimation results of {merged['shards']} shards ({merged['rows_no']} rows) saved to "
+                  f"{os.path.join(aspect_dir, merged['files']['results'])}")
+        print(f"s-measure results of {merged['clusters_total']} clusters from {merged['shards']} shards saved to "
+              f"{os.path.join(aspect_dir, merged['files']['s_values'])}")
+
+
+def smeasure(options):
+
+    #s-measure is computed again from enrichment results file, clusters are not tested
+    if not os.path.isdir(options.ouput_dir):
+        sys.exit(f"Exiting....\n Project output directory {options.ouput_dir} does not exist.")
+    for aspect, aspect_dir in get_aspect_dirs(options).items():
+        enrichment_results_file_path = os.path.join(aspect_dir, ENRICHMENT_RESULTS_FILES[options.results_format])
+        go_names_file_path = os.path.join(aspect_dir, GO_NAMES_FILE)
+        for file in (enrichment_results_file_path, go_names_file_path):
+            if not os.path.exists(file):
+                sys.exit(f"Exiting....\n File {file} does not exist. \
+                 \n Run analysis without --smeasure_only first or check --results_format")
+        s_values_file = os.path.join(aspect_dir, S_VALUES_FILE)
+        analyse_cluster = AnaliseCluster(enrichment_results_file_path, "0")
+        analyse_cluster.read_enrichment_results()
+        analyse_cluster.count_c()
+        analyse_cluster.save(s_values_file, go_names_file_path)
+        print(f"s-measure results for GBSC clusters from {enrichment_results_file_path} saved to {s_values_file}")
+
+
+def run_sweep(options, aspect_files, clusters, result_cache):
+
+    #hypergeometric tests of every annotation store are run once and corrected with every alpha,
+    #every setting has its own s-measure table
+    settings = []
+    for aspect_dir, go_annotations_file_path, go_names_file_path, enrichment_results_file_path \
+            in aspect_files.values():
+        print(f"Sweep of alpha {', '.join(map(str, options.sweep_alphas))} for annotations in {aspect_dir}")
+        sinks = {}
+        for alpha in options.sweep_alphas:
+            s_values_file = os.path.join(aspect_dir, SWEEP_S_VALUES_FILE.format(alpha=alpha))
+            analyse_cluster = AnaliseCluster(None, str(len(settings)))
+            settings.append((analyse_cluster, aspect_dir, alpha, s_values_file, go_names_file_path))
+            sinks[alpha] = SMeasureSink(analyse_cluster, s_values_file)
+
+        with performance.stage("enrichment"):
+            run_go_analyse(SweepSink(sinks, options.correction, options.tarone), go_annotations_file_path,
+                           options.sweep_alphas[0], clusters, workers=options.workers, result_cache=result_cache,
+                           tail_cache_size=options.tail_cache_size)
+
+    settings_file = os.path.join(options.ouput_dir, SWEEP_SETTINGS_FILE)
+    with performance.stage("s-measure"), open(settings_file, "w") as f:
+        f.write("parameter_no\tannotations\talpha\tclusters with s-measure\ts-measure file\n")
+        for analyse_cluster, aspect_dir, alpha, s_values_file, go_names_file_path in settings:
+            analyse_cluster.count_c()
+            analyse_cluster.save(s_values_file, go_names_file_path)
+            f.write(f"{analyse_cluster.params_no}\t{aspect_dir}\t{alpha}\t{analyse_cluster.cl_no}\t{s_values_file}\n")
+            print(f"s-measure results for alpha={alpha}, annotations {aspect_dir} saved to {s_values_file}")
+
+    print(f"Sweep settings saved to {settings_file}")
+
+
 def get_options():
     parser = OptionParser(description="desc")
     parser.add_option("-c", "--gbsc_clusters", dest="gbsc_clusters", default=None,
-                      help="Path to the directory with GBSC clusters", metavar="DIR")
-    parser.add_option("-a", "--alpha", dest="alpha", default=0.05,
+                      help="Path to the directory with GBSC clusters, tar archive of cluster files "
+                           "or multi-cluster FASTA file", metavar="DIR")
+    parser.add_option("-a", "--alpha", dest="alpha", default=0.05, type="float",
                       help="Threshold of test significance", metavar="FLOAT")
     parser.add_option('-o', '--ouput_dir', default='./gbsc_functional_results/', 
                       help='Output directory. Should be the same as used in 01_download_go.py')
+    parser.add_option("-s", "--aspect", dest="aspect", default=None, type="choice",
+                      choices=list(ASPECT_DICT) + [ALL_ASPECTS],
+                      help=f"GO aspect of output directory written by 01_download_go.py --aspect={ALL_ASPECTS}: "
+                           f"F, P, C or {ALL_ASPECTS} - every aspect in one run, results are written to "
+                           f"its subdirectory (default: annotations of a single aspect in output directory)",
+                      metavar="F/P/C/all")
     parser.add_option('-l', '--log_file', default='gbsc_functional_analysis.log', 
                       help='Log file name')
+    parser.add_option("--debug", dest="debug", action="store_true", default=False,
+                      help="Write debug messages (e.g. parameters of every GO term test) to log file")
+    parser.add_option("--performance_report", dest="performance_report", default=None,
+                      help=f"JSON file with stage timings, counters and peak memory of the run "
+                           f"(default: {PERFORMANCE_REPORT_FILE} in output directory)", metavar="FILE")
+    parser.add_option("-w", "--workers", dest="workers", default=1, type="int",
+                      help="Number of worker processes for clusters analysis", metavar="INT")
+    parser.add_option("--tail_cache_size", dest="tail_cache_size", default=64, type="float",
+                      help="Maximum size of hypergeometric tail tables per (cluster size, GO term count) kept by "
+                           "every worker, least recently used tables are removed; 0 - compute every test with scipy",
+                      metavar="MB")
+    parser.add_option("--correction", dest="correction", default="cluster", type="choice",
+                      choices=["cluster", "global"],
+                      help="Multiple testing correction within each cluster or across all clusters and GO terms",
+                      metavar="cluster/global")
+    parser.add_option("--results_format", dest="results_format", default="tsv", type="choice",
+                      choices=list(RESULT_FORMATS),
+                      help="Format of enrichment results file: tsv, parquet or arrow (Arrow IPC, "
+                           "parquet and arrow require pyarrow)", metavar="FORMAT")
+    parser.add_option("--significant_only", dest="significant_only", action="store_true", default=False,
+                      help="Write only GO terms significant after Bonferroni or Benjamini-Hochberg correction")
+    parser.add_option("--no_results_file", dest="no_results_file", action="store_true", default=False,
+                      help="Do not write enrichment results file, only s-measure results")
+    parser.add_option("--tarone", dest="tarone", action="store_true", default=False,
+                      help="Do not test GO terms whose minimum attainable p-value can not be significant "
+                           "(Tarone's procedure; Bonferroni correction uses Tarone's factor)")
+    parser.add_option("--sweep_alphas", dest="sweep_alphas", default=None,
+                      help="Comma separated thresholds of test significance, e.g. 0.01,0.05,0.1. Tests are run once "
+                           "and s-measure is saved for every alpha (and annotations of --sweep_annotations) to "
+                           f"{SWEEP_S_VALUES_FILE.format(alpha='ALPHA')}; --alpha is not used and enrichment "
+                           "results files are not written", metavar="FLOATS")
+    parser.add_option("--sweep_annotations", dest="sweep_annotations", default=None,
+                      help="Comma separated output directories of other 01_download_go.py runs (e.g. with "
+                           "--exclude_IEA=yes) analysed in the same sweep, s-measure tables are saved there",
+                      metavar="DIRS")
+    parser.add_option("--shard", dest="shard", default=None,
+                      help="Test only shard i of N shards of clusters (i from 0 to N - 1), chosen by stable hash of "
+                           "cluster name; results and manifest are written to shards/shard_i_of_N in output directory",
+                      metavar="i/N")
+    parser.add_option("--merge", dest="merge", action="store_true", default=False,
+                      help="Combine results of all shards into enrichment results and s-measure files of output "
+                           "directory, checking that every cluster was tested exactly once")
+    parser.add_option("--smeasure_only", dest="smeasure_only", action="store_true", default=False,
+                      help="Compute s-measure of clusters from enrichment results file of output directory "
+                           "without testing clusters again")
+    parser.add_option("--use_result_cache", dest="use_result_cache", action="store_true", default=False,
+                      help=f"Take results of clusters tested in earlier runs from SQLite cache {RESULT_CACHE_FILE} "
+                           f"in output directory and add new results to it")
+    parser.add_option("--result_cache", dest="result_cache", default=None,
+                      help="SQLite cache of cluster results used instead of the one in output directory, "
+                           "implies --use_result_cache", metavar="FILE")
+    parser.add_option("--result_cache_max_size", dest="result_cache_max_size", default=1024, type="float",
+                      help="Maximum size of cluster results cache, least recently used results are removed",
+                      metavar="MB")
+    parser.add_option("--no_result_cache", dest="no_result_cache", action="store_true", default=False,
+                      help="Test all clusters without using cluster results cache (default, overrides "
+                           "--use_result_cache and --result_cache)")
     options, args = parser.parse_args()
     return  options, args
 
@@ -0,0 +1,308 @@
+"""
+GBSC Clusters GO Ontology Functional Analysis Pipeline
+=======================================================
+
+Benchmarks of annotation and enrichment hot paths on synthetic data, and of
+startup (imports) of the command line. Run from the repository root:
+
+    python -m benchmarks.run_benchmarks --scale small
+    python -m benchmarks.run_benchmarks --scale medium --save_baseline
+
+Every benchmark reports the best time of --repeat runs. Times are compared
+with baselines stored for the same scale and the run fails (exit code 1) when
+any benchmark is slower than baseline * --threshold. HTTP stages use a local
+QuickGO stub server, so no network access is needed.
+
+Author: Aleksandra Gruca (2026)
+"""
+
+import contextlib
+import io
+import json
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+from optparse import OptionParser
+
+from benchmarks import synthetic
+from benchmarks.stub_server import QuickGOStub
+from src import annotations
+from src.analyse_clusters import AnaliseCluster
+from src.downloader import AnnotationDownloader, QuickGOUnavailableError
+from src.go_analise import AnnotationIndex, TSVResultSink, _init_worker, calc, get_results_header, run_go_analyse
+from src.utils import get_proteins
+
+BENCHMARKS_DIR = os.path.dirname(os.path.abspath(__file__))
+REPOSITORY_DIR = os.path.dirname(BENCHMARKS_DIR)
+BASELINES_FILE = os.path.join(BENCHMARKS_DIR, "baselines.json")
+
+SCALES = dict(
+    tiny=dict(proteins=2000, clusters=200, terms=500),
+    small=dict(proteins=10 ** 4, clusters=10 ** 3, terms=2000),
+    medium=dict(proteins=10 ** 5, clusters=10 ** 4, terms=10 ** 4),
+    large=dict(proteins=10 ** 6, clusters=10 ** 5, terms=4 * 10 ** 4),
+)
+
+
+class Data:
+    """Synthetic ontology, annotations, 01_download_go.py output directory and clusters in work_dir."""
+
+    def __init__(self, work_dir: str, proteins: int, clusters: int, terms: int, seed: int = 0):
+        self.work_dir = work_dir
+        self.parents = synthetic.make_ontology(terms, seed=seed)
+        self.closure = synthetic.get_closure(self.parents)
+        self.annotations = synthetic.make_annotations(proteins, self.parents, seed=seed)
+        self.output_dir = os.path.join(work_dir, "output")
+        self.cluster_dir = os.path.join(work_dir, "clusters")
+        self.protein_list = os.path.join(work_dir, "protein_ids.txt")
+        synthetic.write_output_dir(self.output_dir, self.annotations, self.closure)
+        synthetic.write_clusters(self.cluster_dir, proteins, self.annotations, clusters, seed=seed)
+        synthetic.write_protein_list(self.protein_list, proteins)
+        self.annotation_store = os.path.join(self.output_dir, "go_annotations_store")
+        self.results_file = os.path.join(self.output_dir, "enrichment_results.csv")
+
+
+def bench_get_proteins(data: Data, options):
+    for file in sorted(os.listdir(data.cluster_dir)):
+        with open(os.path.join(data.cluster_dir, file)) as f:
+            for protein in get_proteins(f):
+                protein.get_acc()
+
+
+def bench_calc(data: Data, options):
+    _init_worker(AnnotationIndex.load(data.annotation_store))
+    files = sorted(os.listdir(data.cluster_dir))
+    for e, file in enumerate(files):
+        calc((file, e, len(files), data.cluster_dir, options.alpha, None))
+
+
+def bench_run_go_analyse(data: Data, options):
+    sink = TSVResultSink(data.results_file, get_results_header(options.alpha))
+    run_go_analyse(sink, data.annotation_store, options.alpha, data.cluster_dir, workers=options.workers)
+
+
+def bench_analyse_cluster(data: Data, options):
+    if not os.path.exists(data.results_file):
+        bench_run_go_analyse(data, options)
+    analyse_cluster = AnaliseCluster(data.results_file, "0")
+    analyse_cluster.read_enrichment_results()
+    analyse_cluster.count_c()
+
+
+def bench_add_ancestors(data: Data, options):
+    ancestors = {go: [go] + sorted(anc) for go, anc in data.closure.items()}
+    annotations.add_ancestors(ancestors, data.annotations)
+
+
+def read_download_proteins(data: Data, options) -> list:
+    with open(data.protein_list, encoding="utf-8") as f:
+        return [line.strip() for line in f][:options.download_proteins]
+
+
+def bench_download(data: Data, options):
+    """get_GO, get_ancestors and fill_names of src.annotations against local QuickGO stub."""
+    stub = QuickGOStub(data.annotations, data.closure)
+    url = stub.start()
+    proteins = read_download_proteins(data, options)
+    names_file = os.path.join(data.work_dir, "download_go_names.csv")
+    try:
+        with contextlib.redirect_stdout(io.StringIO()):
+            proteins_go, all_go, protein_go_dict = annotations.get_GO(
+                proteins, exclude=[], aspect="F", workers=options.download_workers, requests_per_second=0,
+                max_retries=0, base_url=url)
+            go_list = {go for goes in proteins_go.values() for go in goes}
+            ancestors, all_go = annotations.get_ancestors(go_list, ancestors_old={}, all_go=all_go, aspect="F",
+                                                          base_url=url)
+            annotations.fill_names(all_go, save_file=names_file, base_url=url)
+    finally:
+        stub.stop()
+        if os.path.exists(names_file):
+            os.remove(names_file)
+
+
+def bench_download_failures(data: Data, options):
+    """Bisection of batch rejected (400) for one accession and abort on unavailable (503) one.
+
+    The run fails when the rejected accession is not the only one in failed or when
+    the download with unavailable accession is not aborted with QuickGOUnavailableError.
+    """
+    proteins = read_download_proteins(data, options)
+    rejected, unavailable = proteins[len(proteins) // 3], proteins[2 * len(proteins) // 3]
+    stub = QuickGOStub(data.annotations, data.closure, rejected=[rejected], unavailable=[unavailable])
+    url = stub.start()
+
+    def get_client():
+        return AnnotationDownloader(base_url=url, workers=options.download_workers, requests_per_second=0,
+                                    max_retries=1, backoff=0)
+
+    try:
+        client = get_client()
+        try:
+            downloaded = sum(len(batch) for batch, text in
+                             client.download_all([protein for protein in proteins if protein != unavailable]))
+        finally:
+            client.close()
+        if client.failed != [rejected] or downloaded != len(proteins) - 2:
+            sys.exit(f"download_failures: failed {client.failed} and {downloaded} downloaded accessions, "
+                     f"expected only {rejected} failed and {len(proteins) - 2} downloaded")
+
+        client = get_client()
+        try:
+            for _ in client.download_all(proteins):
+                pass
+        except QuickGOUnavailableError:
+            pass
+        else:
+            sys.exit(f"download_failures: download with unavailable {unavailable} was not aborted")
+        finally:
+            client.close()
+    finally:
+        stub.stop()
+
+
+def run_python(*args) -> None:
+    subprocess.run([sys.executable, *args], cwd=REPOSITORY_DIR, check=True, stdout=subprocess.DEVNULL)
+
+
+def bench_import_analysis(data: Data, options):
+    """Startup of a new interpreter importing enrichment code, without scipy and statsmodels of tests."""
+    run_python("-c", "import src.go_analise")
+
+
+def bench_cli_download_help(data: Data, options):
+    run_python("gbsc.py", "download", "--help")
+
+
+def bench_cli_enrich_help(data: Data, options):
+    run_python("gbsc.py", "enrich", "--help")
+
+
+BENCHMARKS = dict(
+    get_proteins=bench_get_proteins,
+    calc=bench_calc,
+    run_go_analyse=bench_run_go_analyse,
+    AnaliseCluster=bench_analyse_cluster,
+    add_ancestors=bench_add_ancestors,
+    download=bench_download,
+    download_failures=bench_download_failures,
+    import_analysis=bench_import_analysis,
+    cli_download_help=bench_cli_download_help,
+    cli_enrich_help=bench_cli_enrich_help,
+)
+
+
+def time_benchmark(function, data: Data, options) -> float:
+    times = []
+    for _ in range(options.repeat):
+        start = time.perf_counter()
+        function(data, options)
+        times.append(time.perf_counter() - start)
+    return min(times)
+
+
+def read_baselines(file: str) -> dict:
+    if not os.path.exists(file):
+        return {}
+    with open(file) as f:
+        return json.load(f)
+
+
+def main(options):
+    if options.scale not in SCALES:
+        sys.exit(f"Unknown scale {options.scale}, use one of: {', '.join(SCALES)}")
+    scale = dict(SCALES[options.scale])
+    for key in scale:
+        if getattr(options, key) is not None:
+            scale[key] = getattr(options, key)
+    scale_name = options.scale if scale == SCALES[options.scale] else \
+        f"{scale['proteins']}p_{scale['clusters']}c_{scale['terms']}t"
+    names = options.only.split(",") if options.only else list(BENCHMARKS)
+    for name in names:
+        if name not in BENCHMARKS:
+            sys.exit(f"Unknown benchmark {name}, use some of: {', '.join(BENCHMARKS)}")
+
+    work_dir = options.work_dir or tempfile.mkdtemp(prefix="gbsc_benchmarks_")
+    try:
+        start = time.perf_counter()
+        data = Data(work_dir, seed=options.seed, **scale)
+        print(f"Synthetic data {scale_name}: {scale} generated in {time.perf_counter() - start:.2f}s")
+
+        results = {}
+        for name in names:
+            results[name] = time_benchmark(BENCHMARKS[name], data, options)
+            print(f"{name:<18} {results[name]:10.4f}s")
+    finally:
+        if not options.keep and not options.work_dir:
+            shutil.rmtree(work_dir, ignore_errors=True)
+
+    if options.output:
+        with open(options.output, "w") as f:
+            json.dump(dict(scale=scale_name, results=results), f, indent=4)
+
+    baselines = read_baselines(options.baseline_file)
+    if options.save_baseline:
+        baselines.setdefault(scale_name, {}).update(results)
+        with open(options.baseline_file, "w") as f:
+            json.dump(baselines, f, indent=4)
+        print(f"Baseline for {scale_name} saved to {options.baseline_file}")
+        return
+
+    baseline = baselines.get(scale_name, {})
+    regressions = []
+    for name, seconds in results.items():
+        if name in baseline:
+            ratio = seconds / baseline[name] if baseline[name] else float("inf")
+            print(f"{name:<18} {ratio:6.2f}x baseline ({baseline[name]:.4f}s)")
+            if ratio > options.threshold:
+                regressions.append(name)
+    if regressions:
+        sys.exit(f"Benchmarks slower than {options.threshold}x baseline: {', '.join(regressions)}")
+
+
+def get_options():
+    parser = OptionParser(description="Benchmarks of GBSC functional analysis on synthetic data")
+    parser.add_option("--scale", dest="scale", default="small",
+                      help=f"Size of synthetic data: {', '.join(SCALES)}", metavar="NAME")
+    parser.add_option("--proteins", dest="proteins", default=None, type="int",
+                      help="Number of proteins, overrides scale", metavar="INT")
+    parser.add_option("--clusters", dest="clusters", default=None, type="int",
+                      help="Number of clusters, overrides scale", metavar="INT")
+    parser.add_option("--terms", dest="terms", default=None, type="int",
+                      help="Number of GO terms, overrides scale", metavar="INT")
+    parser.add_option("--only", dest="only", default=None,
+                      help=f"Comma separated benchmarks to run: {', '.join(BENCHMARKS)}", metavar="NAMES")
+    parser.add_option("--repeat", dest="repeat", default=3, type="int",
+                      help="Runs of every benchmark, the best time is reported", metavar="INT")
+    parser.add_option("--alpha", dest="alpha", default=0.05, type="float",
+                      help="Threshold of test significance", metavar="FLOAT")
+    parser.add_option("--workers", dest="workers", default=1, type="int",
+                      help="Worker processes of run_go_analyse", metavar="INT")
+    parser.add_option("--download_proteins", dest="download_proteins", default=10 ** 4, type="int",
+                      help="Proteins downloaded from stub server in download benchmark", metavar="INT")
+    parser.add_option("--download_workers", dest="download_workers", default=4, type="int",
+                      help="Concurrent requests in download benchmark", metavar="INT")
+    parser.add_option("--seed", dest="seed", default=0, type="int",
+                      help="Seed of synthetic data generator", metavar="INT")
+    parser.add_option("--baseline_file", dest="baseline_file", default=BASELINES_FILE,
+                      help="JSON file with baseline times per scale", metavar="FILE")
+    parser.add_option("--save_baseline", dest="save_baseline", action="store_true", default=False,
+                      help="Store times of this run as baseline instead of comparing with it")
+    parser.add_option("--threshold", dest="threshold", default=1.3, type="float",
+                      help="Fail when benchmark takes longer than baseline times threshold", metavar="FLOAT")
+    parser.add_option("--output", dest="output", default=None,
+                      help="JSON file with times of this run", metavar="FILE")
+    parser.add_option("--work_dir", dest="work_dir", default=None,
+                      help="Directory for synthetic data (default: temporary directory removed at the end)",
+                      metavar="DIR")
+    parser.add_option("--keep", dest="keep", action="store_true", default=False,
+                      help="Keep temporary directory with synthetic data")
+    options, args = parser.parse_args()
+    return options, args
+
+
+if __name__ == "__main__":
+    options, args = get_options()
+    main(options)
@@ -0,0 +1,111 @@
+"""
+GBSC Clusters GO Ontology Functional Analysis Pipeline
+=======================================================
+
+Local stand-in for QuickGO services used by benchmarks, so HTTP stages of
+01_download_go.py run offline. Serves annotation/downloadSearch TSV and
+ontology/go/terms (with /ancestors) JSON from synthetic data. Annotation
+requests for chosen accessions can be rejected (400) or fail as if QuickGO
+was unavailable (503).
+
+Author: Aleksandra Gruca (2026)
+"""
+
+import json
+import threading
+import urllib.parse
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Iterable
+
+from benchmarks.synthetic import ASPECT
+
+ANNOTATION_HEADER = "GENE PRODUCT DB\tGENE PRODUCT ID\tSYMBOL\tQUALIFIER\tGO TERM\tGO ASPECT\tECO ID\tGO EVIDENCE CODE"
+
+
+class QuickGOStub:
+    """Threaded HTTP server answering QuickGO requests for synthetic annotations and ontology.
+
+    Annotation requests containing any of rejected accessions get status 400 (as QuickGO
+    answers for malformed accessions) and requests containing any of unavailable ones 503.
+    """
+
+    def __init__(self, annotations: dict, closure: dict, rejected: Iterable[str] = (),
+                 unavailable: Iterable[str] = ()):
+        self.annotations = annotations
+        self.closure = closure
+        self.rejected = set(rejected)
+        self.unavailable = set(unavailable)
+        self.requests_no = 0
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def log_message(self, *args):
+                pass
+
+            def do_GET(self):
+                stub.requests_no += 1
+                url = urllib.parse.urlparse(self.path)
+                if url.path.endswith("/annotation/downloadSearch"):
+                    status = stub.get_annotations_status(url)
+                    if status != 200:
+                        self.send_response(status)
+                        self.send_header("Content-Length", "0")
+                        self.end_headers()
+                        return
+                    body, content_type = stub.get_annotations(url), "text/tsv"
+                elif "/ontology/go/terms/" in url.path:
+                    body, content_type = stub.get_terms(url), "application/json"
+                else:
+                    self.send_response(404)
+                    self.end_headers()
+                    return
+                body = body.encode("utf-8")
+                self.send_response(200)
+                self.send_header("Content-Type", content_type)
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self.url = f"http://127.0.0.1:{self.server.server_port}"
+        self._thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+
+    @staticmethod
+    def get_proteins(url) -> list:
+        return urllib.parse.parse_qs(url.query).get("geneProductId", [""])[0].split(",")
+
+    def get_annotations_status(self, url) -> int:
+        proteins = set(self.get_proteins(url))
+        if proteins & self.unavailable:
+            return 503
+        if proteins & self.rejected:
+            return 400
+        return 200
+
+    def get_annotations(self, url) -> str:
+        rows = [ANNOTATION_HEADER]
+        for protein in self.get_proteins(url):
+            for go in self.annotations.get(protein, ()):
+                rows.append(f"UniProtKB\t{protein}\t{protein}\tenables\t{go}\t{ASPECT}\tECO:0000314\tIDA")
+        return "\n".join(rows)
+
+    def get_terms(self, url) -> str:
+        parts = url.path.split("/")
+        ancestors = parts[-1] == "ancestors"
+        ids = urllib.parse.unquote(parts[-2] if ancestors else parts[-1]).split(",")
+        results = []
+        for go in ids:
+            if go in self.closure:
+                result = dict(id=go, name=f"synthetic term {go}", aspect=ASPECT)
+                if ancestors:
+                    result["ancestors"] = [go] + sorted(self.closure[go])
+                results.append(result)
+        return json.dumps(dict(results=results))
+
+    def start(self) -> str:
+        self._thread.start()
+        return self.url
+
+    def stop(self) -> None:
+        self.server.shutdown()
+        self.server.server_close()
@@ -0,0 +1,122 @@
+"""
+GBSC Clusters GO Ontology Functional Analysis Pipeline
+=======================================================
+
+Synthetic data for benchmarks: GO ontology DAG, direct protein annotations,
+output directory of 01_download_go.py and GBSC-style cluster directory at
+configurable scale.
+
+Author: Aleksandra Gruca (2026)
+"""
+
+import json
+import os
+import random
+
+from src.annotation_store import write_annotation_store
+
+ASPECT = "molecular_function"
+
+
+def go_id(i: int) -> str:
+    return f"GO:{i + 1:07d}"
+
+
+def protein_acc(i: int) -> str:
+    return f"S{i:07d}"
+
+
+def make_ontology(terms_no: int, max_parents: int = 3, seed: int = 0) -> dict:
+    """GO ID -> parents; GO:0000001 is the root and parents of a term have lower ids.
+
+    Parents are drawn uniformly from all earlier terms, so depth of the DAG grows
+    with log of its size as in GO.
+    """
+    rng = random.Random(seed)
+    parents = {go_id(0): []}
+    for i in range(1, terms_no):
+        parents[go_id(i)] = sorted({go_id(rng.randrange(i)) for _ in range(rng.randint(1, max_parents))})
+    return parents
+
+
+def get_closure(parents: dict) -> dict:
+    """GO ID -> all its ancestors (without the term itself)."""
+    closure = {}
+    for go, go_parents in parents.items():
+        ancestors = set(go_parents)
+        for parent in go_parents:
+            ancestors.update(closure[parent])
+        closure[go] = ancestors
+    return closure
+
+
+def make_annotations(proteins_no: int, parents: dict, terms_per_protein: int = 4, annotated: float = 0.85,
+                     seed: int = 0) -> dict:
+    """Protein accession -> direct GO terms; term popularity follows Zipf-like distribution."""
+    rng = random.Random(seed)
+    terms = list(parents)
+    weights = [1 / (rank + 1) ** 0.8 for rank in range(len(terms))]
+    rng.shuffle(weights)
+    annotations = {}
+    for i in range(proteins_no):
+        if rng.random() < annotated:
+            annotations[protein_acc(i)] = sorted(set(rng.choices(terms, weights, k=rng.randint(1, terms_per_protein))))
+    return annotations
+
+
+def propagate(annotations: dict, closure: dict) -> dict:
+    result = {}
+    for protein, goes in annotations.items():
+        protein_goes = set(goes)
+        for go in goes:
+            protein_goes.update(closure[go])
+        result[protein] = sorted(protein_goes)
+    return result
+
+
+def write_output_dir(output_dir: str, annotations: dict, closure: dict) -> None:
+    """Writes go_annotations.json, go_annotations_store and go_names.csv as 01_download_go.py does."""
+    os.makedirs(output_dir, exist_ok=True)
+    propagated = propagate(annotations, closure)
+    with open(os.path.join(output_dir, "go_annotations.json"), "w", encoding="utf-8") as f:
+        json.dump(propagated, f, indent=4)
+    write_annotation_store(propagated.items(), os.path.join(output_dir, "go_annotations_store"))
+    with open(os.path.join(output_dir, "go_names.csv"), "w") as f:
+        for go in closure:
+            f.write(f"{go}\tsynthetic term {go}\t{ASPECT}\n")
+
+
+def write_clusters(cluster_dir: str, proteins_no: int, annotations: dict, clusters_no: int,
+                   min_size: int = 2, max_size: int = 40, enriched: float = 0.6, seed: int = 0) -> None:
+    """Writes one FASTA file per cluster with UniProt-like headers.
+
+    About enriched fraction of members of every cluster share a randomly chosen
+    GO term, the rest are random proteins, so clusters have s-measure below 1.
+    """
+    rng = random.Random(seed)
+    os.makedirs(cluster_dir, exist_ok=True)
+    term_proteins = {}
+    for protein, goes in annotations.items():
+        for go in goes:
+            term_proteins.setdefault(go, []).append(protein)
+    terms = [go for go, proteins in term_proteins.items() if len(proteins) >= min_size]
+    for c in range(clusters_no):
+        size = rng.randint(min_size, max_size)
+        members = set()
+        if terms:
+            candidates = term_proteins[rng.choice(terms)]
+            members.update(rng.sample(candidates, min(len(candidates), int(size * enriched))))
+        while len(members) < size:
+            members.add(protein_acc(rng.randrange(proteins_no)))
+        name = f"C{c:06d}"
+        with open(os.path.join(cluster_dir, f"{name}.fasta"), "w") as f:
+            for acc in sorted(members):
+                sequence = "".join(rng.choices("ACDEFGHIKLMNPQRSTVWY", k=rng.randint(60, 300)))
+                f.write(f">sp|{acc}|{acc}_SYNTH Synthetic protein OS=Synthetic OX=0|1|{len(sequence)}|{name}\n")
+                for i in range(0, len(sequence), 60):
+                    f.write(sequence[i:i + 60] + "\n")
+
+
+def write_protein_list(file: str, proteins_no: int) -> None:
+    with open(file, "w", encoding="utf-8") as f:
+        f.write("\n".join(protein_acc(i) for i in range(proteins_no)))
@@ -0,0 +1,56 @@
+"""
+GBSC Clusters GO Ontology Functional Analysis Pipeline
+=======================================================
+
+Single command line for all stages of the pipeline:
+
+    python gbsc.py download -i input/protein_ids.txt -o output       # 01_download_go.py
+    python gbsc.py enrich -c input/clusters_acc -o output             # 02_gbsc_functional_analysis.py
+    python gbsc.py smeasure -o output                                 # s-measure from enrichment results
+    python gbsc.py merge -o output                                    # results of --shard runs
+
+Options of every command are options of its script (python gbsc.py COMMAND
+--help). Only the script of the command is loaded, so e.g. download does not
+import scipy and smeasure does not import requests.
+
+Author: Aleksandra Gruca (2026)
+"""
+
+import os
+import runpy
+import sys
+
+SCRIPTS_DIR = os.path.dirname(os.path.abspath(__file__))
+
+#command -> (script, options added to command line, description)
+COMMANDS = dict(
+    download=("01_download_go.py", [], "Download GO annotations of proteins"),
+    enrich=("02_gbsc_functional_analysis.py", [], "GO enrichment and s-measure of GBSC clusters"),
+    smeasure=("02_gbsc_functional_analysis.py", ["--smeasure_only"],
+              "s-measure of clusters from existing enrichment results"),
+    merge=("02_gbsc_functional_analysis.py", ["--merge"], "Combine results of --shard runs"),
+)
+
+
+def get_usage() -> str:
+    commands = "\n".join(f"  {command:<10} {description} ({script})"
+                         for command, (script, extra_args, description) in COMMANDS.items())
+    return f"Usage: gbsc.py COMMAND [options]\n\nCommands:\n{commands}\n\n" \
+           f"Options of a command: gbsc.py COMMAND --help"
+
+
+def main(argv):
+    if not argv or argv[0] in ("-h", "--help"):
+        print(get_usage())
+        return
+    command = argv[0]
+    if command not in COMMANDS:
+        sys.exit(f"Unknown command {command}\n\n{get_usage()}")
+    script, extra_args, description = COMMANDS[command]
+    #script is run as __main__ and parses its options from sys.argv
+    sys.argv = [script] + argv[1:] + extra_args
+    runpy.run_path(os.path.join(SCRIPTS_DIR, script), run_name="__main__")
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
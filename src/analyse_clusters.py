@@ -9,6 +9,11 @@ Author: Aleksanra Gruca (2026)
 Original: Joanna Ziemska-Legiecka (2025)
 """
 
+import numpy as np
+
+from src.go_analise import ResultSink, iter_result_file
+
+
 def count_s_measure(cluster_sign_GO, cluster_size):
     return cluster_sign_GO / cluster_size
 
@@ -28,28 +33,42 @@ class AnaliseCluster:
                                                        self.clusters_info[cl_name]["cluster_size"])
 
     def read_enrichment_results(self):
-        cl_names = set()
-        with open(self.file_name) as f:
-            next(f)
-            for l in f:
-                if l.strip():
-                    line = l.strip().split()
-                #"GBSC cluster\tGO ID\tp-value\tAll proteins\tAll proteins annotated with GO\
-                #\tCluster size\tProteins annotated with GO in cluster\tBonferroni corrected p-value\t
-                # \tBonferroni significance results, alpha={options.alpha}\tBenjamini-Hochberg corrected p-value\tBenjamini-Hochberg significance results, alpha={options.alpha}\n")                   
-                    cluster, go, hypergeom_p_val, sequence_no, go_seq_no, cl_size, cluster_go_seq_no, bonferoni_correct, bonf_bool_test, BH_corrected, BH_bool_test = line
-                    cl_size = int(cl_size)
-                    if cl_size > 1 and BH_bool_test == "True":
-                        cl_names.add(cluster)
-                        cluster_go_seq_no=int(cluster_go_seq_no)
-                        if cluster not in self.clusters_info:
-                            self.clusters_info[cluster] = {"GO": go, "GO_sequences": cluster_go_seq_no,
-                                                           "cluster_size": cl_size}
-                        else:
-                            if self.clusters_info[cluster]["GO_sequences"] < cluster_go_seq_no:
-                                    self.clusters_info[cluster] = {"GO": go, "GO_sequences": cluster_go_seq_no,
-                                                               "cluster_size": cl_size}
-        self.cl_no = len(cl_names)
+        #TSV, Parquet or Arrow IPC file written by run_go_analyse
+        for line in iter_result_file(self.file_name):
+            #"GBSC cluster\tGO ID\tp-value\tAll proteins\tAll proteins annotated with GO\
+            #\tCluster size\tProteins annotated with GO in cluster\tBonferroni corrected p-value\t
+            # \tBonferroni significance results, alpha={options.alpha}\tBenjamini-Hochberg corrected p-value\tBenjamini-Hochberg significance results, alpha={options.alpha}\n")
+            cluster, go, hypergeom_p_val, sequence_no, go_seq_no, cl_size, cluster_go_seq_no, bonferoni_correct, bonf_bool_test, BH_corrected, BH_bool_test = line
+            self.add_result(cluster, go, cl_size, cluster_go_seq_no, BH_bool_test)
+
+    def add_result(self, cluster, go, cl_size, cluster_go_seq_no, BH_bool_test):
+        cl_size = int(cl_size)
+        if cl_size > 1 and str(BH_bool_test) == "True":
+            cluster_go_seq_no=int(cluster_go_seq_no)
+            if cluster not in self.clusters_info:
+                self.clusters_info[cluster] = {"GO": go, "GO_sequences": cluster_go_seq_no,
+                                               "cluster_size": cl_size}
+                self.cl_no += 1
+            else:
+                if self.clusters_info[cluster]["GO_sequences"] < cluster_go_seq_no:
+                        self.clusters_info[cluster] = {"GO": go, "GO_sequences": cluster_go_seq_no,
+                                                   "cluster_size": cl_size}
+
+    def get_s_values(self, go_names_dict=None):
+        """(cluster, cluster size, s-measure, main GO ID, main GO name) sorted by s-measure, highest first."""
+        #reverse sort keys (cluster) based on value of self.c_value_cl
+        sorted_clusters = sorted(
+            self.clusters_info.keys(),
+            key=lambda cluster: self.c_value_cl[cluster],
+            reverse=True
+        )
+        go_names_dict = go_names_dict if go_names_dict is not None else {}
+        s_values = []
+        for cluster in sorted_clusters:
+            cluster_data = self.clusters_info[cluster]
+            s_values.append((cluster, cluster_data['cluster_size'], self.c_value_cl[cluster], cluster_data['GO'],
+                             go_names_dict.get(cluster_data['GO'])))
+        return s_values
 
     def save(self, file, go_names_file_path):
 
@@ -60,21 +79,46 @@ class AnaliseCluster:
                 if len(parts) >= 2 and not parts[0].startswith("#"):
                     go_names_dict[parts[0]] = parts[1]    
 
-        with open(file, "w") as f:
-            f.write(f"cluster_name;seq_no;s-measure;main GO ID;main GO name;\n")
-            #for cluster, cluster_data in self.clusters_info.items():
-            #    f.write(f"{cluster};{cluster_data['GO']};{cluster_data['cluster_size']};{self.c_value_cl[cluster]}\n")
+        save_s_values(file, [(cluster, cluster_size, s_value, go, go_names_dict[go])
+                             for cluster, cluster_size, s_value, go, _ in self.get_s_values()])
+
+
+def save_s_values(file, s_values):
+    with open(file, "w") as f:
+        f.write(f"cluster_name;seq_no;s-measure;main GO ID;main GO name;\n")
+        #for cluster, cluster_data in self.clusters_info.items():
+        #    f.write(f"{cluster};{cluster_data['GO']};{cluster_data['cluster_size']};{self.c_value_cl[cluster]}\n")
+        for cluster, cluster_size, s_value, go, go_name in s_values:
+            f.write(f"{cluster};{cluster_size};{s_value};{go};{go_name}\n")
+
+
+def read_s_values(file):
+    """(cluster, cluster size, s-measure, main GO ID, main GO name) text fields of file written by save_s_values."""
+    s_values = []
+    with open(file) as f:
+        next(f)
+        for line in f:
+            if line.strip():
+                s_values.append(tuple(line.rstrip("\n").split(";", 4)))
+    return s_values
+
 
+class SMeasureSink(ResultSink):
+    """Feeds results of run_go_analyse to AnaliseCluster while clusters are tested,
+    so s-measure does not need to read enrichment results file."""
 
-            #reverse sort keys (cluster) based on value of self.c_value_cl
-            sorted_clusters = sorted(
-                self.clusters_info.keys(), 
-                key=lambda cluster: self.c_value_cl[cluster], 
-                reverse=True
-            )
+    def __init__(self, analyse_cluster, output_file=None):
+        super().__init__(output_file)
+        self.analyse_cluster = analyse_cluster
 
-            for cluster in sorted_clusters:
-                cluster_data = self.clusters_info[cluster]
-                go_name = go_names_dict[cluster_data['GO']]
-                f.write(f"{cluster};{cluster_data['cluster_size']};{self.c_value_cl[cluster]};{cluster_data['GO']};{go_name}\n")        
+    def write(self, file, result, bonf_correction, bh):
+        #only GO term with most proteins among BH significant ones matters, first one wins ties
+        if result and result.N > 1:
+            significant = np.flatnonzero(bh[1])
+            if len(significant):
+                best = significant[np.argmax(result.x[significant])]
+                self.analyse_cluster.add_result(file, result.go_ids[best], result.N, int(result.x[best]), True)
 
+    def _write_rows(self, rows):
+        for row in rows:
+            self.analyse_cluster.add_result(row[0], row[1], row[5], row[6], row[10])
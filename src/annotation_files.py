@@ -0,0 +1,143 @@
+"""
+GBSC Clusters GO Ontology Functional Analysis Pipeline
+=======================================================
+
+Reading GO annotations from local GAF or GPAD files (plain or gzip compressed),
+used in place of QuickGO downloadSearch requests.
+
+Author: Aleksandra Gruca (2026)
+"""
+
+import logging
+from collections import Counter
+from typing import Iterable
+
+from src.ontology import ASPECT_DICT, get_aspect_keys
+from src.utils import open_text_file
+
+# GO evidence codes of ECO codes in GPAD files without go_evidence property: default ECO codes of all
+# GO evidence codes (gaf-eco-mapping.txt of Evidence & Conclusion Ontology) and ECO terms "... used in
+# automatic assertion" mapped to IEA. Rows with other ECO codes are kept with --exclude_IEA and reported
+ECO_TO_GO_EVIDENCE = {
+    "ECO:0000269": "EXP", "ECO:0000314": "IDA", "ECO:0000353": "IPI", "ECO:0000315": "IMP",
+    "ECO:0000316": "IGI", "ECO:0000270": "IEP", "ECO:0006056": "HTP", "ECO:0007005": "HDA",
+    "ECO:0007001": "HMP", "ECO:0007003": "HGI", "ECO:0007007": "HEP", "ECO:0000318": "IBA",
+    "ECO:0000319": "IBD", "ECO:0000320": "IKR", "ECO:0000321": "IRD", "ECO:0000250": "ISS",
+    "ECO:0000266": "ISO", "ECO:0000247": "ISA", "ECO:0000255": "ISM", "ECO:0000317": "IGC",
+    "ECO:0000245": "RCA", "ECO:0000304": "TAS", "ECO:0000303": "NAS", "ECO:0000305": "IC",
+    "ECO:0000307": "ND",
+    "ECO:0000501": "IEA",  # evidence used in automatic assertion
+    "ECO:0000203": "IEA",  # automatic assertion (obsolete)
+    "ECO:0000256": "IEA",  # match to sequence model evidence used in automatic assertion
+    "ECO:0000265": "IEA",  # sequence orthology evidence used in automatic assertion
+    "ECO:0000322": "IEA",  # imported manually asserted information used in automatic assertion
+    "ECO:0000323": "IEA",  # imported automatically asserted information used in automatic assertion
+    "ECO:0000363": "IEA",  # computational inference used in automatic assertion
+    "ECO:0000366": "IEA",  # logical inference from automatic annotation used in automatic assertion
+    "ECO:0007669": "IEA",  # computational evidence used in automatic assertion
+}
+
+
+def detect_annotation_format(annotation_file: str) -> str:
+    with open_text_file(annotation_file) as f:
+        for line in f:
+            if not line.startswith("!"):
+                break
+            header = line[1:].strip().lower()
+            if header.startswith("gaf-version"):
+                return "gaf"
+            if header.startswith("gpa-version") or header.startswith("gpad-version"):
+                return "gpad"
+    raise ValueError(f"Unknown format of annotation file {annotation_file}, expected GAF or GPAD header")
+
+
+def _parse_gaf_line(columns: list) -> tuple:
+    # DB, DB Object ID, Symbol, Qualifier, GO ID, Reference, Evidence Code, With, Aspect, ...
+    return columns[1], columns[4], columns[6], columns[8]
+
+
+def _parse_gpad_line(columns: list) -> tuple:
+    # GPAD 1.1: DB, DB Object ID, Qualifier, GO ID, Reference, ECO, ..., Annotation Properties
+    # GPAD 2.0: DB:DB Object ID, Negation, Relation, GO ID, Reference, ECO, ..., Annotation Properties
+    if ":" in columns[0]:
+        protein_acc = columns[0].split(":", 1)[1]
+    else:
+        protein_acc = columns[1]
+    evidence = ECO_TO_GO_EVIDENCE.get(columns[5], columns[5])
+    if len(columns) > 11:
+        for annotation_property in columns[11].split("|"):
+            if annotation_property.startswith("go_evidence="):
+                evidence = annotation_property.split("=", 1)[1]
+    return protein_acc, columns[3], evidence, None
+
+
+def get_GO_from_file(
+        annotation_file: str,
+        protein_list: Iterable[str],
+        exclude: list,
+        aspect: str,
+        ontology=None,
+) -> (dict, set, dict):
+    """Stream GAF/GPAD file and collect GO terms of requested proteins.
+
+    Returns the same structures as 01_download_go.get_GO. Only annotations of
+    proteins from protein_list are kept, so memory does not depend on the size
+    of the annotation file. GPAD files do not store aspect of GO term, so for
+    them ontology (src.ontology.GeneOntology) is required.
+    """
+    return get_GO_from_file_aspects(annotation_file, protein_list, exclude, (aspect,), ontology)[aspect]
+
+
+def get_GO_from_file_aspects(
+        annotation_file: str,
+        protein_list: Iterable[str],
+        exclude: list,
+        aspects: Iterable[str] = ASPECT_DICT,
+        ontology=None,
+) -> dict:
+    """get_GO_from_file for several aspects in one pass over the file; returns aspect -> (result, all_go, protein_go_dict)."""
+    annotation_format = detect_annotation_format(annotation_file)
+    if annotation_format == "gpad" and ontology is None:
+        raise ValueError("GO ontology file is required to read aspects of GO terms from GPAD file")
+    parse_line = _parse_gaf_line if annotation_format == "gaf" else _parse_gpad_line
+
+    aspect_keys = get_aspect_keys(aspects)
+    results = {aspect: ({}, set()) for aspect in aspects}
+    proteins = set(protein_list)
+    unmapped_eco = Counter()
+    with open_text_file(annotation_file) as f:
+        for e, line in enumerate(f):
+            if line.startswith("!") or not line.strip():
+                continue
+            if e % 1000000 == 0:
+                logging.info(f"Read {e} lines of {annotation_file}")
+            columns = line.rstrip("\n").split("\t")
+            protein_acc, protein_go, evidence, aspect_go = parse_line(columns)
+            if protein_acc not in proteins or evidence in exclude:
+                continue
+            if exclude and evidence.startswith("ECO:"):
+                unmapped_eco[evidence] += 1
+            if aspect_go is None:
+                aspect_go = ontology.get_aspect(protein_go)
+            aspect = aspect_keys.get(aspect_go)
+            if aspect is not None:
+                result, all_go = results[aspect]
+                all_go.add(protein_go)
+                result.setdefault(protein_acc, []).append(protein_go)
+
+    if unmapped_eco:
+        #evidence of these rows is unknown, so they can not be excluded
+        message = (f"Warning: {sum(unmapped_eco.values())} annotations with ECO codes without GO evidence code "
+                   f"were not checked for excluded evidence codes: "
+                   f"{', '.join(f'{eco} ({count})' for eco, count in unmapped_eco.most_common())}")
+        logging.info(message)
+        print(message)
+
+    aspect_results = {}
+    for aspect, (result, all_go) in results.items():
+        protein_go_dict = dict(result)
+        for protein_acc in proteins:
+            result.setdefault(protein_acc, [])
+        aspect_results[aspect] = result, all_go, protein_go_dict
+    print(*(len(protein_go_dict) for result, all_go, protein_go_dict in aspect_results.values()), len(proteins))
+    return aspect_results
@@ -0,0 +1,131 @@
+"""
+GBSC Clusters GO Ontology Functional Analysis Pipeline
+=======================================================
+
+Compact binary store of protein GO annotations, written by 01_download_go.py
+next to go_annotations.json. Proteins and GO terms are interned to integer ids
+and annotations are kept in CSR layout: GO term ids of protein i are
+indices[offsets[i]:offsets[i + 1]]. Arrays are saved as .npy files and opened
+with numpy memmap, so loading does not parse the annotations.
+
+Author: Aleksandra Gruca (2026)
+"""
+
+import hashlib
+import os
+from array import array
+from typing import Iterable, Iterator
+
+import numpy as np
+
+PROTEINS_FILE = "proteins.txt"
+TERMS_FILE = "terms.txt"
+OFFSETS_FILE = "offsets.npy"
+INDICES_FILE = "indices.npy"
+GO_COUNTS_FILE = "go_counts.npy"
+VERSION_FILE = "version.txt"
+
+
+class AnnotationStoreWriter:
+    """Collects (protein, GO terms) pairs and writes them as annotation store."""
+
+    def __init__(self, store_dir: str = None):
+        self.store_dir = store_dir
+        self.proteins = []
+        self.term_ids = {}
+        self.offsets = array("q", [0])
+        self.indices = array("i")
+
+    def add(self, protein: str, goes: Iterable[str]) -> None:
+        term_ids = {self.term_ids.setdefault(go, len(self.term_ids)) for go in goes}
+        self.proteins.append(protein)
+        self.indices.extend(sorted(term_ids))
+        self.offsets.append(len(self.indices))
+
+    def feed(self, annotations: Iterable[tuple]) -> Iterator[tuple]:
+        """Adds pairs to the store while passing them on, e.g. to JSON writer."""
+        for protein, goes in annotations:
+            self.add(protein, goes)
+            yield protein, goes
+
+    def to_arrays(self) -> tuple:
+        """Returns proteins, terms, offsets, indices, go_counts and version, as load_annotation_store."""
+        indices = np.frombuffer(self.indices, dtype=np.int32) if self.indices else np.empty(0, dtype=np.int32)
+        offsets = np.frombuffer(self.offsets, dtype=np.int64)
+        go_counts = np.bincount(indices, minlength=len(self.term_ids)).astype(np.int64)
+        terms = list(self.term_ids)
+        version = get_annotation_version(self.proteins, terms, offsets, indices)
+        return self.proteins, terms, offsets, indices, go_counts, version
+
+    def close(self) -> None:
+        os.makedirs(self.store_dir, exist_ok=True)
+        proteins, terms, offsets, indices, go_counts, version = self.to_arrays()
+        np.save(os.path.join(self.store_dir, OFFSETS_FILE), offsets)
+        np.save(os.path.join(self.store_dir, INDICES_FILE), indices)
+        np.save(os.path.join(self.store_dir, GO_COUNTS_FILE), go_counts)
+        with open(os.path.join(self.store_dir, PROTEINS_FILE), "w", encoding="utf-8") as f:
+            f.write("\n".join(self.proteins))
+        with open(os.path.join(self.store_dir, TERMS_FILE), "w", encoding="utf-8") as f:
+            f.write("\n".join(self.term_ids))
+        with open(os.path.join(self.store_dir, VERSION_FILE), "w", encoding="utf-8") as f:
+            f.write(version)
+
+
+def get_annotation_version(proteins: list, terms: list, offsets: np.ndarray, indices: np.ndarray) -> str:
+    """Content hash of annotations, identifies results computed with them (e.g. in cluster results cache)."""
+    version = hashlib.sha256()
+    version.update("\n".join(proteins).encode("utf-8"))
+    version.update(b"\0")
+    version.update("\n".join(terms).encode("utf-8"))
+    version.update(np.ascontiguousarray(offsets, dtype=np.int64).tobytes())
+    version.update(np.ascontiguousarray(indices, dtype=np.int32).tobytes())
+    return version.hexdigest()
+
+
+def write_annotation_store(annotations: Iterable[tuple], store_dir: str) -> None:
+    writer = AnnotationStoreWriter(store_dir)
+    for protein, goes in annotations:
+        writer.add(protein, goes)
+    writer.close()
+
+
+def is_annotation_store(path: str) -> bool:
+    return os.path.isfile(os.path.join(path, OFFSETS_FILE))
+
+
+def get_annotation_store_mtime(store_dir: str) -> float:
+    #files are overwritten in place, so mtime of directory does not change when store is written again;
+    #version file is written last by every close (stores without it fall back to offsets file)
+    version_file = os.path.join(store_dir, VERSION_FILE)
+    if os.path.exists(version_file):
+        return os.path.getmtime(version_file)
+    return os.path.getmtime(os.path.join(store_dir, OFFSETS_FILE))
+
+
+def _read_lines(file: str) -> list:
+    with open(file, encoding="utf-8") as f:
+        text = f.read()
+    return text.split("\n") if text else []
+
+
+def load_annotation_store(store_dir: str) -> tuple:
+    """Returns proteins, terms, offsets, indices, go_counts and version; arrays are read-only memmaps."""
+    proteins = _read_lines(os.path.join(store_dir, PROTEINS_FILE))
+    terms = _read_lines(os.path.join(store_dir, TERMS_FILE))
+    offsets = np.load(os.path.join(store_dir, OFFSETS_FILE), mmap_mode="r")
+    indices = np.load(os.path.join(store_dir, INDICES_FILE), mmap_mode="r")
+    go_counts = np.load(os.path.join(store_dir, GO_COUNTS_FILE), mmap_mode="r")
+    version_file = os.path.join(store_dir, VERSION_FILE)
+    if os.path.exists(version_file):
+        with open(version_file, encoding="utf-8") as f:
+            version = f.read().strip()
+    else:
+        version = get_annotation_version(proteins, terms, offsets, indices)
+    return proteins, terms, offsets, indices, go_counts, version
+
+
+def iter_annotation_store(store_dir: str) -> Iterator[tuple]:
+    """Streams (protein, GO terms) pairs, e.g. to export the store back to JSON."""
+    proteins, terms, offsets, indices, go_counts, version = load_annotation_store(store_dir)
+    for i, protein in enumerate(proteins):
+        yield protein, [terms[j] for j in indices[offsets[i]:offsets[i + 1]]]
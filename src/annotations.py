@@ -0,0 +1,356 @@
+"""
+GBSC Clusters GO Ontology Functional Analysis Pipeline
+=======================================================
+
+GO annotation acquisition from QuickGO: direct annotations of proteins,
+ancestors of their GO terms within aspect, GO names and annotation files with
+ancestors. Used by 01_download_go.py and by the pipeline API (src/pipeline.py).
+
+Author: Aleksandra Gruca (2026)
+Original: Joanna Ziemska-Legiecka (2025)
+"""
+
+import itertools
+import json
+import logging
+import typing
+
+from src.annotation_store import AnnotationStoreWriter
+from src.downloader import QUICKGO_URL, AnnotationDownloader, get_terms, get_term_ancestors
+from src.http_cache import cached_get
+from src.ontology import ASPECT_DICT, get_aspect_keys
+
+
+#cache of QuickGO responses, set by 01_download_go.py main or pipeline; None means requests go directly to QuickGO
+response_cache = None
+
+
+#checkpoint journal, set by 01_download_go.py main; None means downloaded data is kept only in memory
+download_journal = None
+
+
+def quickgo_get(url, headers=None, timeout=None):
+    return cached_get(response_cache, url, headers=headers, timeout=timeout)
+
+
+def get_journaled_terms(go_ids, base_url=QUICKGO_URL) -> dict:
+    """get_terms which takes already downloaded terms from journal and saves new ones to it."""
+    known = download_journal.terms if download_journal is not None else {}
+    terms = {go: known[go] for go in go_ids if go in known}
+    callback = download_journal.add_terms if download_journal is not None else None
+    terms.update(get_terms([go for go in go_ids if go not in known], callback=callback,
+                           base_url=base_url, cache=response_cache))
+    return terms
+
+
+def get_journaled_ancestors(go_ids, base_url=QUICKGO_URL) -> dict:
+    """get_term_ancestors which takes already downloaded ancestors from journal and saves new ones to it."""
+    known = download_journal.ancestors if download_journal is not None else {}
+    ancestors = {go: known[go] for go in go_ids if go in known}
+    callback = download_journal.add_ancestors if download_journal is not None else None
+    ancestors.update(get_term_ancestors([go for go in go_ids if go not in known], callback=callback,
+                                        base_url=base_url, cache=response_cache))
+    return ancestors
+
+
+def get_names(go_ids, base_url=QUICKGO_URL) -> dict:
+    """GO ID -> (name, aspect) of GO terms found in QuickGO."""
+    go_ids = list(go_ids)
+    print(f"Downloading names of {len(go_ids)} GO terms")
+    terms = get_journaled_terms(go_ids, base_url=base_url)
+    for go_id in go_ids:
+        if go_id not in terms:
+            logging.info(f"Lack of GO name for {go_id}")
+    return terms
+
+
+def write_names(go_ids, terms: dict, save_file: str) -> None:
+    #one buffered write of all names instead of reopening the file for every term
+    with open(save_file, "a") as f:
+        for go_id in go_ids:
+            if go_id in terms:
+                go_name, aspect = terms[go_id]
+                f.write(f"{go_id}\t{go_name}\t{aspect}\n")
+
+
+def fill_names(go_ids, save_file="/tmp/tmp_go.csv", base_url=QUICKGO_URL):
+    go_ids = list(go_ids)
+    write_names(go_ids, get_names(go_ids, base_url=base_url), save_file)
+
+
+def parse_annotation_tsv(
+        text: str,
+        protein_run: list,
+        exclude: list,
+        aspect: str,
+        result: dict,
+        all_go: set
+) -> None:
+    parse_annotation_tsv_aspects(text, protein_run, exclude, {aspect: (result, all_go)})
+
+
+def parse_annotation_tsv_aspects(
+        text: str,
+        protein_run: list,
+        exclude: list,
+        results: dict
+) -> None:
+    """parse_annotation_tsv for several aspects in one pass; results maps aspect -> (result, all_go)."""
+    aspect_keys = get_aspect_keys(results)
+    protein_run = set(protein_run)
+    for line in text.split("\n"):
+        new_line = line.split("\t")
+        if not line.startswith("GENE PRODUCT DB") and line.strip():
+            if new_line[1] in protein_run:
+                protein_go = new_line[4]
+                aspect = aspect_keys.get(new_line[5])
+                if aspect is not None:
+                    annotation_type_go = new_line[7]
+                    if annotation_type_go not in exclude:
+                        result, all_go = results[aspect]
+                        all_go.add(protein_go)
+                        if new_line[1] not in result:
+                            result[new_line[1]] = [protein_go]
+                        else:
+                            result[new_line[1]].append(protein_go)
+
+
+def journal_annotations(results: dict, proteins: list) -> None:
+    """Saves direct GO terms of proteins to journal; results maps aspect -> protein -> GO terms.
+
+    With one aspect GO terms of protein are saved as list, with several as dict aspect -> list.
+    """
+    if download_journal is None:
+        return
+    if len(results) == 1:
+        (result,) = results.values()
+        download_journal.add_annotations({protein_acc: result[protein_acc] for protein_acc in proteins})
+    else:
+        download_journal.add_annotations({protein_acc: {aspect: result[protein_acc] for aspect, result in results.items()}
+                                          for protein_acc in proteins})
+
+
+def get_journaled_annotations(protein_acc: str, aspect: str) -> list:
+    """Direct GO terms of protein in aspect saved to journal by journal_annotations."""
+    annotations = download_journal.annotations[protein_acc]
+    if isinstance(annotations, dict):
+        return list(annotations.get(aspect, []))
+    return list(annotations)
+
+
+def get_GO(
+        protein_list: iter,
+        exclude: list,
+        #save_go_file: str,
+        aspect: str,
+        #lack_goes: str,
+        workers: int = 4,
+        requests_per_second: float = 10,
+        max_retries: int = 5,
+        base_url: str = QUICKGO_URL,
+) -> (typing.Dict, set):
+    return get_GO_aspects(protein_list, exclude, (aspect,), workers=workers, requests_per_second=requests_per_second,
+                          max_retries=max_retries, base_url=base_url)[aspect]
+
+
+def get_GO_aspects(
+        protein_list: iter,
+        exclude: list,
+        aspects: typing.Iterable[str] = ASPECT_DICT,
+        workers: int = 4,
+        requests_per_second: float = 10,
+        max_retries: int = 5,
+        base_url: str = QUICKGO_URL,
+) -> dict:
+    """get_GO for several aspects from one download; returns aspect -> (result, all_go, protein_go_dict)."""
+    results = {aspect: ({}, set()) for aspect in aspects}
+    protein_go_dicts = {aspect: {} for aspect in results}
+    
+    #protein_list = [i for i in protein_list]
+    begining = len(protein_list)
+    batches = [protein_list[i:i + 100] for i in range(0, begining, 100)]
+    number_seq = len(batches)
+    downloader = AnnotationDownloader(base_url=base_url,
+                                      workers=workers,
+                                      requests_per_second=requests_per_second,
+                                      max_retries=max_retries,
+                                      cache=response_cache)
+    done = 0
+    for e, (protein_run, text) in enumerate(downloader.download(batches)):
+        logging.info(f"GO info downloaded for {protein_run[0]}.. ({len(protein_run)} accessions) {e}/{number_seq}")
+        if not text.strip():
+            print("lack of content", protein_run)
+        parse_annotation_tsv_aspects(text, protein_run, exclude, results)
+        for aspect, (result, all_go) in results.items():
+            protein_go_dict = protein_go_dicts[aspect]
+            for protein_acc in protein_run:
+                if protein_acc in result.keys():
+                    #TO CLEAN
+                    # logging.info(f"Save go in {save_go_file} data:{str(set(result[protein_acc]))} ")
+                    #save_go(save_go_file, {protein_acc: set(result[protein_acc])}, mode="a")
+                    protein_go_dict[protein_acc] = result[protein_acc]
+            #    else:
+            #        with open(lack_goes, "a") as f:
+            #            f.write(protein_acc + "\n")
+                if not result.get(protein_acc):
+                    result[protein_acc] = []
+        journal_annotations({aspect: result for aspect, (result, all_go) in results.items()}, protein_run)
+        done += len(protein_run)
+        print(*(len(protein_go_dict) for protein_go_dict in protein_go_dicts.values()), begining - done, begining, done)
+    downloader.close()
+    if downloader.failed:
+        print(f"GO info could not be downloaded for {len(downloader.failed)} proteins: {downloader.failed}")
+        for protein_acc in downloader.failed:
+            for result, all_go in results.values():
+                result.setdefault(protein_acc, [])
+    print(f"QuickGO annotation requests: {downloader.requests_no}")
+    return {aspect: (result, all_go, protein_go_dicts[aspect]) for aspect, (result, all_go) in results.items()}
+
+
+def check_aspects(go_ids, all_go, aspect, base_url=QUICKGO_URL) -> set:
+    """GO IDs which belong to aspect: in all_go or with this aspect in QuickGO."""
+    return check_aspects_all(go_ids, {aspect: all_go}, base_url=base_url)[aspect]
+
+
+def check_aspects_all(go_ids, all_gos: dict, base_url=QUICKGO_URL) -> dict:
+    """check_aspects for several aspects with one lookup of GO terms; all_gos maps aspect -> all_go."""
+    aspect_keys = get_aspect_keys(all_gos)
+    go_ids = set(go_ids)
+    in_aspects = {aspect: go_ids & all_go for aspect, all_go in all_gos.items()}
+    terms = get_journaled_terms(go_ids - set.intersection(*in_aspects.values()), base_url=base_url)
+    for go, (go_name, aspect_go) in terms.items():
+        aspect = aspect_keys.get(aspect_go)
+        if aspect is not None:
+            in_aspects[aspect].add(go)
+    return in_aspects
+
+
+def get_ancestors(
+        go_list: set,
+        #save_go_file: str,
+        ancestors_old: dict,
+        all_go: set,
+        aspect: str,
+        base_url: str = QUICKGO_URL
+) -> (dict, set):
+    go_list = [go for go in go_list if go not in ancestors_old]
+    return get_ancestors_aspects({aspect: go_list}, {aspect: all_go}, base_url=base_url)[aspect]
+
+
+def get_ancestors_aspects(
+        go_lists: dict,
+        all_gos: dict,
+        base_url: str = QUICKGO_URL
+) -> dict:
+    """get_ancestors for several aspects with one download of ancestors and GO terms.
+
+    go_lists and all_gos map aspect -> GO terms, returns aspect -> (ancestors, all_go).
+    """
+    go_ids = list(dict.fromkeys(go for go_list in go_lists.values() for go in go_list))
+    print(f"Downloading ancestors of {len(go_ids)} GO terms")
+    go_ancestors = get_journaled_ancestors(go_ids, base_url=base_url)
+    #aspects of all ancestors are checked together instead of one request per ancestor
+    in_aspects = check_aspects_all({i for anc in go_ancestors.values() for i in anc}, all_gos, base_url=base_url)
+    results = {}
+    for aspect, go_list in go_lists.items():
+        all_go, in_aspect = all_gos[aspect], in_aspects[aspect]
+        ancestors = {}
+        for go in go_list:
+            if go not in go_ancestors:
+                logging.info(f"Lack of GO ancestor info for {go}")
+                ancestors[go] = []
+                continue
+            ancestors[go] = [i for i in go_ancestors[go] if i != go and i in in_aspect]
+            all_go = all_go.union(set(ancestors[go]))
+        results[aspect] = ancestors, all_go
+    return results
+
+
+def get_max_path(child: str, main_GO: str):
+    url_path = f"https://www.ebi.ac.uk/QuickGO/services/ontology/go/terms/{child}/paths/{main_GO}/"
+    req_path = quickgo_get(url_path)
+    if req_path:
+        max_path_len = 0
+        for result_path in req_path.json()["results"]:
+            if len(result_path) > max_path_len:
+                max_path_len = len(result_path)
+                return max_path_len
+        return max_path_len
+
+
+def get_paths(go: iter, path_path: str, aspect: str):
+    aspect_dict = dict(F="GO:0003674",
+                       molecular_function="GO:0003674",
+                       P="GO:0008150",
+                       biological_process="GO:0008150",
+                       C="GO:0005575",
+                       cellular_component="GO:0005575")
+    with open(path_path, "w") as f:
+        for go_id in go:
+            path_len = get_max_path(go_id, aspect_dict[aspect])
+            f.write(f"{go_id}\t{path_len}\n")
+
+def propagate_ancestors(
+        ancestors: dict,
+        go_protein: typing.Iterable[tuple]
+) -> typing.Iterator[tuple]:
+    """Streams (protein, GO terms with ancestors) for (protein, direct GO terms) pairs.
+
+    Every GO term is mapped once to its closure (the term and its ancestors), so
+    each protein needs only one set union over its own annotations.
+    """
+    closure = {go: frozenset(anc).union((go,)) for go, anc in ancestors.items()}
+    for e, (protein, goes) in enumerate(go_protein):
+        if e % 1000 == 0:
+            logging.info(f"Add ancestors to {protein} {e}")
+        protein_goes = set(goes)
+        for go in goes:
+            protein_goes.update(closure.get(go, ()))
+        yield protein, sorted(protein_goes)
+
+
+def add_ancestors(
+        ancestors: dict,
+        go_protein: dict
+) -> dict:
+    return dict(propagate_ancestors(ancestors, go_protein.items()))
+
+
+def write_annotation_json(annotations: typing.Iterable[tuple], ouput_annotation_file) -> None:
+    """Writes (protein, GO terms) pairs one by one in the layout of json.dump(..., indent=4)."""
+    with open(ouput_annotation_file, 'w', encoding='utf-8') as f:
+        first = True
+        for protein, goes in annotations:
+            f.write("{\n" if first else ",\n")
+            f.write(json.dumps({protein: goes}, indent=4, ensure_ascii=False)[2:-2])
+            first = False
+        f.write("{}" if first else "\n}")
+
+
+#old prepare_data function from go_analyse.py
+def crate_annotation_file(all_go, ancestors, ouput_annotation_file, existing_annotations=None,
+                          annotation_store=None, write_json=True):
+    
+    logging.info(f"Add ancestors info to protein GO")    
+    annotations = propagate_ancestors(ancestors, all_go.items())
+
+    #annotations from previous run (already with ancestors) are kept in update mode
+    if existing_annotations:
+        annotations = itertools.chain(
+            ((protein, goes) for protein, goes in existing_annotations.items() if protein not in all_go),
+            annotations)
+
+    #binary annotation store is filled in the same pass as JSON file
+    store_writer = None
+    if annotation_store:
+        store_writer = AnnotationStoreWriter(annotation_store)
+        annotations = store_writer.feed(annotations)
+
+    if write_json:
+        write_annotation_json(annotations, ouput_annotation_file)
+    else:
+        for _ in annotations:
+            pass
+
+    if store_writer is not None:
+        store_writer.close()
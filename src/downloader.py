@@ -0,0 +1,272 @@
+"""
+GBSC Clusters GO Ontology Functional Analysis Pipeline
+=======================================================
+
+Concurrent download of QuickGO annotation and ontology batches over one pooled
+HTTP session, with requests-per-second limit, exponential backoff with jitter
+and bisection of rejected batches down to the accession or GO ID that breaks them.
+
+Author: Aleksandra Gruca (2026)
+"""
+
+import json
+import logging
+import random
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Iterable, Iterator
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from src import performance
+from src.http_cache import cached_get
+
+QUICKGO_URL = "https://www.ebi.ac.uk/QuickGO/services"
+
+# responses worth retrying, other errors (e.g. 400 for malformed accession) go straight to bisection
+RETRY_STATUS_CODES = {429, 500, 502, 503, 504}
+
+
+class QuickGOUnavailableError(Exception):
+    """Request still failing with timeouts, connection errors or retryable status after all retries."""
+
+
+class RateLimiter:
+    """Spreads requests of all threads evenly, at most requests_per_second (0 - no limit)."""
+
+    def __init__(self, requests_per_second: float):
+        self.interval = 1.0 / requests_per_second if requests_per_second > 0 else 0.0
+        self._next = 0.0
+        self._lock = threading.Lock()
+
+    def wait(self) -> None:
+        if not self.interval:
+            return
+        with self._lock:
+            now = time.monotonic()
+            slot = max(now, self._next)
+            self._next = slot + self.interval
+        if slot > now:
+            time.sleep(slot - now)
+
+
+class QuickGOClient:
+    """Batched QuickGO requests over one pooled requests.Session.
+
+    Up to workers requests are in flight at once. A batch rejected by QuickGO
+    (e.g. 400 for a malformed id) is split in halves, so only the ids that cannot
+    be downloaded end up in failed. Timeouts, connection errors and retryable
+    status codes are retried max_retries times, then download is aborted with
+    QuickGOUnavailableError, as splitting would only multiply failing requests.
+    """
+
+    batch_size = 100
+    accept = "application/json"
+
+    def __init__(
+            self,
+            base_url: str = QUICKGO_URL,
+            workers: int = 4,
+            requests_per_second: float = 10,
+            max_retries: int = 5,
+            backoff: float = 1.0,
+            timeout: float = 10,
+            cache=None,
+    ):
+        self.base_url = base_url.rstrip("/")
+        self.workers = max(1, workers)
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self.timeout = timeout
+        self.cache = cache
+        self.rate_limiter = RateLimiter(requests_per_second)
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=self.workers)
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+        self.failed = []
+        self.requests_no = 0
+        self._lock = threading.Lock()
+        #first request which failed after all retries, other batches stop with the same error
+        self.error = None
+        self._aborted = threading.Event()
+
+    def get_url(self, batch: list) -> str:
+        raise NotImplementedError
+
+    def _sleep_backoff(self, attempt: int) -> None:
+        delay = min(60.0, self.backoff * 2 ** attempt)
+        time.sleep(delay + random.uniform(0, self.backoff))
+
+    def _fetch(self, batch: list):
+        """Response text, or None when QuickGO rejects the batch."""
+        url = self.get_url(batch)
+        header = dict(Accept=self.accept)
+        error = None
+        for attempt in range(self.max_retries + 1):
+            if self._aborted.is_set():
+                raise self.error
+            try:
+                with self._lock:
+                    self.requests_no += 1
+                req = cached_get(self.cache, url, headers=header, timeout=self.timeout,
+                                 session=self.session, rate_limiter=self.rate_limiter)
+            except requests.RequestException as err:
+                logging.info(f"Request for {batch[0]}.. ({len(batch)} ids) failed: {err}")
+                error = err
+            else:
+                if req.status_code == 200:
+                    return req.text
+                logging.info(f"Request for {batch[0]}.. ({len(batch)} ids) status_code={req.status_code}")
+                if req.status_code not in RETRY_STATUS_CODES:
+                    return None
+                error = f"status_code={req.status_code}"
+            if attempt < self.max_retries:
+                self._sleep_backoff(attempt)
+        with self._lock:
+            if self.error is None:
+                self.error = QuickGOUnavailableError(f"QuickGO request for {batch[0]}.. ({len(batch)} ids) "
+                                                     f"failed after {self.max_retries} retries: {error}")
+        self._aborted.set()
+        raise self.error
+
+    def _download_batch(self, batch: list) -> list:
+        text = self._fetch(batch)
+        if text is not None:
+            return [(batch, text)]
+        if len(batch) == 1:
+            logging.info(f"QuickGO info can not be downloaded for {batch[0]}")
+            with self._lock:
+                self.failed.append(batch[0])
+            return []
+        middle = len(batch) // 2
+        return self._download_batch(batch[:middle]) + self._download_batch(batch[middle:])
+
+    def download(self, batches: list) -> Iterator[tuple]:
+        """Yields (ids, response text) in the order of batches.
+
+        Raises QuickGOUnavailableError when a batch can not be downloaded, batches
+        not started yet are cancelled.
+        """
+        executor = ThreadPoolExecutor(max_workers=self.workers)
+        try:
+            for downloaded in executor.map(self._download_batch, batches):
+                yield from downloaded
+        finally:
+            executor.shutdown(wait=True, cancel_futures=True)
+
+    def download_all(self, ids: Iterable[str]) -> Iterator[tuple]:
+        ids = list(ids)
+        yield from self.download([ids[i:i + self.batch_size] for i in range(0, len(ids), self.batch_size)])
+
+    def close(self) -> None:
+        self.session.close()
+
+
+class AnnotationDownloader(QuickGOClient):
+    """Downloads QuickGO downloadSearch TSV for batches of protein accessions."""
+
+    accept = "text/tsv"
+
+    def get_url(self, batch: list) -> str:
+        return f"{self.base_url}/annotation/downloadSearch?geneProductId={','.join(batch)}"
+
+
+class OntologyClient(QuickGOClient):
+    """Names, aspects and ancestors of many GO terms per QuickGO ontology request.
+
+    Responses are cached per GO ID, not per batch URL, so a changed set of terms
+    reuses all cached terms and only the missing ones are requested.
+    """
+
+    batch_size = 200
+    relations = ("is_a", "part_of", "occurs_in", "regulates")
+
+    def __init__(self, *args, ancestors: bool = False, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.ancestors = ancestors
+        #batch responses are not cached, they are split into entries of single terms
+        self.term_cache, self.cache = self.cache, None
+
+    def get_url(self, batch: list) -> str:
+        ids = ",".join(batch).replace(":", "%3A")
+        if self.ancestors:
+            return f"{self.base_url}/ontology/go/terms/{ids}/ancestors?relations={'%2C'.join(self.relations)}"
+        return f"{self.base_url}/ontology/go/terms/{ids}"
+
+    def get_term_key(self, go_id: str) -> str:
+        #key of the response to request for this term alone
+        return self.term_cache.make_key(self.get_url([go_id]), dict(Accept=self.accept))
+
+    def get_cached(self, go_ids: list) -> tuple:
+        """QuickGO records of cached GO IDs (None for terms QuickGO did not return) and list of other IDs."""
+        records, missing = {}, []
+        for go_id in go_ids:
+            cached = self.term_cache.get(self.get_term_key(go_id)) if self.term_cache is not None else None
+            if cached is None:
+                missing.append(go_id)
+            else:
+                results = json.loads(cached[1]).get("results", [])
+                records[go_id] = results[0] if results else None
+        if records:
+            logging.info(f"Cached QuickGO ontology records for {len(records)} of {len(go_ids)} GO IDs")
+            performance.count("http_cache_hits", len(records))
+        return records, missing
+
+    def put_cached(self, batch: list, records: dict) -> None:
+        #terms missing from response are cached too, so they are not requested again until TTL
+        if self.term_cache is None:
+            return
+        for go_id in batch:
+            record = records.get(go_id)
+            body = json.dumps(dict(results=[record] if record is not None else []))
+            self.term_cache.put(self.get_term_key(go_id), 200, body)
+
+    def get_results(self, go_ids: Iterable[str], convert, callback=None) -> dict:
+        """Maps requested GO IDs to convert(QuickGO result record), skipping records converted to None.
+
+        callback, if given, is called with results of cached terms and of every completed batch.
+        """
+        def convert_records(records: dict) -> dict:
+            converted = {}
+            for go_id, record in records.items():
+                value = convert(record) if record is not None else None
+                if value is not None:
+                    converted[go_id] = value
+            return converted
+
+        #GO IDs come from sets, sorted so requests are the same in every run
+        cached, missing = self.get_cached(sorted(set(go_ids)))
+        results = convert_records(cached)
+        if results and callback is not None:
+            callback(results)
+        for batch, text in self.download_all(missing):
+            batch = set(batch)
+            records = {result["id"]: result for result in json.loads(text).get("results", [])
+                       if result.get("id") in batch}
+            self.put_cached(batch, records)
+            batch_results = convert_records(records)
+            if callback is not None:
+                callback(batch_results)
+            results.update(batch_results)
+        return results
+
+
+def get_terms(go_ids: Iterable[str], callback=None, **kwargs) -> dict:
+    """GO ID -> (name, aspect) for all terms found in QuickGO."""
+    client = OntologyClient(**kwargs)
+    try:
+        return client.get_results(go_ids, lambda result: (result.get("name"), result.get("aspect")), callback)
+    finally:
+        client.close()
+
+
+def get_term_ancestors(go_ids: Iterable[str], callback=None, **kwargs) -> dict:
+    """GO ID -> list of ancestors for all terms found in QuickGO."""
+    client = OntologyClient(ancestors=True, **kwargs)
+    try:
+        return client.get_results(go_ids, lambda result: result.get("ancestors"), callback)
+    finally:
+        client.close()
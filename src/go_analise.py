@@ -12,18 +12,40 @@ Original: Joanna Ziemska-Legiecka (2025)
 import os
 import sys
 import json
+import shutil
 import logging
+import tempfile
+import importlib
+from collections import Counter, OrderedDict
+from contextlib import nullcontext
 from multiprocessing import Pool
+from typing import Iterable
 
 
-from scipy.stats import hypergeom
-from statsmodels.stats.multitest import multipletests
+import numpy as np
 
-from src.utils import get_proteins
+from src import performance
+from src.annotation_store import AnnotationStoreWriter, is_annotation_store, load_annotation_store
+from src.result_cache import ClusterResultCache
+from src.utils import get_accessions, read_packed_clusters
 
 
 logger = logging.getLogger(__name__)
 
+#scipy.stats and statsmodels take most of startup time, they are imported by functions
+#running tests, so stages not testing clusters (help, merge, s-measure) start without them
+TEST_MODULES = ("scipy.stats", "statsmodels.stats.multitest")
+
+# annotation index shared read-only by calc in the main process and in pool
+# workers, so it is not pickled together with every cluster task
+_annotation_index = None
+
+# hypergeometric tail tables of this process, set together with annotation index
+_tail_cache = None
+
+# pruning of untestable GO terms (None, "tarone" or "alpha", see prune_untestable), set together with annotation index
+_prune = None
+
 
 def read_mapped_file(file, sign="\t"):
     result = {}
@@ -43,75 +65,407 @@ def read_mapped_file(file, sign="\t"):
 
 
 
-def calc_hypergeometric_test(
+class AnnotationIndex:
+    """Precomputed lookup tables over GO annotations of all proteins.
+
+    Built or loaded once per run, so per-cluster tests do not rescan all
+    annotations. Annotations are kept in CSR layout of src.annotation_store:
+    GO term ids of protein i are indices[offsets[i]:offsets[i + 1]] and
+    go_counts[j] is number of all proteins annotated with GO term j.
+    proteins_no is number of all annotated proteins and version is content
+    hash of annotations.
+    """
+
+    def __init__(self, proteins: list, terms: list, offsets: np.ndarray, indices: np.ndarray,
+                 go_counts: np.ndarray, version: str = None):
+        self.proteins = proteins
+        self.version = version
+        self.terms = terms
+        self.offsets = offsets
+        self.indices = indices
+        self.go_counts = go_counts
+        self.protein_ids = {acc: i for i, acc in enumerate(proteins)}
+        self.term_ids = {go: i for i, go in enumerate(terms)}
+        self.proteins_no = len(proteins)
+
+    @classmethod
+    def from_dict(cls, protein_go: dict) -> "AnnotationIndex":
+        writer = AnnotationStoreWriter()
+        for acc, goes in protein_go.items():
+            writer.add(acc, goes)
+        return cls(*writer.to_arrays())
+
+    @classmethod
+    def load(cls, go_annotations_file: str) -> "AnnotationIndex":
+        """Opens binary annotation store (memory mapped) or reads go_annotations.json."""
+        if is_annotation_store(go_annotations_file):
+            return cls(*load_annotation_store(go_annotations_file))
+        with open(go_annotations_file, 'r', encoding='utf-8') as f:
+            return cls.from_dict(json.load(f))
+
+    def get_protein_go(self, acc: str):
+        i = self.protein_ids.get(acc)
+        if i is None:
+            return None
+        return frozenset(self.terms[j] for j in self.indices[self.offsets[i]:self.offsets[i + 1]].tolist())
+
+    def select_cluster(self, cluster_proteins: Iterable[str]) -> dict:
+        return {acc: self.get_protein_go(acc) for acc in cluster_proteins if acc in self.protein_ids}
+
+    def get_go_count(self, go: str) -> int:
+        j = self.term_ids.get(go)
+        return int(self.go_counts[j]) if j is not None else 0
+
+
+def count_proteins_for_go(proteins_go: dict) -> Counter:
+    return Counter(go for goes in proteins_go.values() for go in set(goes))
+
+
+class HypergeomTailCache:
+    """Upper tails P(X >= x) of hypergeometric distribution for all x, one table per (M, m, N).
+
+    M is constant within a run and cluster sizes N and GO term counts m repeat
+    across clusters, so a repeated test costs a table lookup. Tables missing
+    for a cluster are computed together with one vectorized call. A table has
+    min(m, N) + 1 values, so least recently used tables are dropped when all
+    tables take more than max_size bytes. Tables are summed from probabilities,
+    so p-values may differ from hypergeom.sf in the last digits.
+    """
+
+    def __init__(self, max_size: int = 64 * 1024 ** 2):
+        self.max_size = max_size
+        self.size = 0
+        self.tables = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def pvalues(self, M: int, m: np.ndarray, N: int, x: np.ndarray) -> np.ndarray:
+        pvalues = np.empty(len(m), dtype=np.float64)
+        missing = {}
+        for i, (m_i, x_i) in enumerate(zip(m.tolist(), x.tolist())):
+            key = (M, m_i, N)
+            table = self.tables.get(key)
+            if table is None:
+                missing.setdefault(m_i, []).append(i)
+            else:
+                self.tables.move_to_end(key)
+                pvalues[i] = table[x_i]
+        misses = sum(len(tests) for tests in missing.values())
+        self.hits += len(m) - misses
+        self.misses += misses
+        if missing:
+            #tail of every table is reverse cumulative sum of probabilities, one logpmf call
+            #for all tables is much cheaper than hypergeom.sf for every x
+            from scipy.stats import hypergeom
+            missing_m = list(missing)
+            lengths = [min(m_i, N) + 1 for m_i in missing_m]
+            tail_x = np.concatenate([np.arange(length) for length in lengths])
+            pmf = np.exp(hypergeom.logpmf(tail_x, M, np.repeat(missing_m, lengths), N))
+            for m_i, table in zip(missing_m, np.split(pmf, np.cumsum(lengths)[:-1])):
+                table = np.minimum(np.cumsum(table[::-1])[::-1], 1.0)
+                pvalues[missing[m_i]] = table[x[missing[m_i]]]
+                if table.nbytes <= self.max_size:
+                    self.tables[(M, m_i, N)] = table
+                    self.size += table.nbytes
+            while self.size > self.max_size:
+                self.size -= self.tables.popitem(last=False)[1].nbytes
+        return pvalues
+
+    def report(self) -> str:
+        tests_no = self.hits + self.misses
+        hit_rate = self.hits / tests_no if tests_no else 0.0
+        return f"Hypergeometric tail cache: hits={self.hits} misses={self.misses} hit_rate={hit_rate:.2%}"
+
+
+class HypergeomTestBatch:
+    """Hypergeometric test results for all GO terms of a single cluster.
+
+    Parameters of the test are kept as arrays aligned with go_ids, so all tail
+    probabilities are computed with one vectorized hypergeom.sf call, or taken
+    from tail_cache tables.
+    """
+
+    def __init__(self, go_ids: list, M: int, m: np.ndarray, N: int, x: np.ndarray,
+                 tail_cache: HypergeomTailCache = None):
+        self.go_ids = go_ids
+        self.M = M  # liczba wszystkich białek
+        self.m = m  # liczba wszystkich białek z badanym GO
+        self.N = N  # rozmiar klastra
+        self.x = x  # liczba białek w klastrze z badanym GO
+        #tests answered from tail cache, counted in main process as workers have their own caches
+        self.tail_cache_hits = 0
+        #GO terms not tested as they can not be significant and Bonferroni denominator set by pruning
+        self.pruned = 0
+        self.correction_tests = None
+        if not go_ids:
+            self.pvalues = np.empty(0)
+        elif tail_cache is not None:
+            hits = tail_cache.hits
+            self.pvalues = tail_cache.pvalues(M, m, N, x)
+            self.tail_cache_hits = tail_cache.hits - hits
+        else:
+            from scipy.stats import hypergeom
+            self.pvalues = hypergeom.sf(x - 1, M, m, N)
+
+    def __len__(self):
+        return len(self.go_ids)
+
+    def select(self, mask: np.ndarray) -> "HypergeomTestBatch":
+        """Batch of GO terms selected by boolean mask, p-values are not computed again."""
+        batch = HypergeomTestBatch([], self.M, self.m[mask], self.N, self.x[mask])
+        batch.go_ids = [go for go, keep in zip(self.go_ids, mask.tolist()) if keep]
+        batch.pvalues = self.pvalues[mask]
+        return batch
+
+    def to_arrays(self) -> tuple:
+        """Plain values and arrays of the batch, stored in cluster results cache instead of the object."""
+        return (self.go_ids, self.M, self.m, self.N, self.x, self.pvalues, self.pruned, self.correction_tests)
+
+    @classmethod
+    def from_arrays(cls, arrays: tuple) -> "HypergeomTestBatch":
+        go_ids, M, m, N, x, pvalues, pruned, correction_tests = arrays
+        batch = cls([], M, m, N, x)
+        batch.go_ids, batch.pvalues = go_ids, pvalues
+        batch.pruned, batch.correction_tests = pruned, correction_tests
+        return batch
+
+    def items(self):
+        for go, pvalue, m, x in zip(self.go_ids, self.pvalues.tolist(), self.m.tolist(), self.x.tolist()):
+            yield go, (pvalue, self.M, m, self.N, x)
+
+
+def get_min_pvalues(M: int, m: np.ndarray, N: int) -> np.ndarray:
+    """Smallest attainable p-values, P(X >= min(m, N)), of GO terms with m proteins in cluster of size N."""
+    from scipy.stats import hypergeom
+    return np.exp(hypergeom.logpmf(np.minimum(m, N), M, m, N))
+
+
+def get_tarone_tests_no(min_pvalues: np.ndarray, alpha: float) -> int:
+    """Tarone's correction factor: smallest k such that at most k terms can reach p-value alpha / k."""
+    sorted_pvalues = np.sort(min_pvalues)
+    k = np.arange(1, len(sorted_pvalues) + 1)
+    testable_no = np.searchsorted(sorted_pvalues, alpha / k, side="right")
+    return int(k[np.argmax(testable_no <= k)])
+
+
+def prune_untestable(M: int, m: np.ndarray, N: int, alpha: float, prune: str) -> tuple:
+    """Mask of GO terms worth testing and Bonferroni denominator.
+
+    "tarone" keeps terms with minimum attainable p-value <= alpha / k, with k
+    from Tarone's procedure used instead of number of terms by Bonferroni
+    correction. "alpha" keeps terms that can reach alpha itself, as needed
+    with correction over all clusters, and the denominator stays the number
+    of tested terms.
+    """
+    if not len(m):
+        return np.ones(0, dtype=bool), None
+    min_pvalues = get_min_pvalues(M, m, N)
+    if prune == "tarone":
+        tests_no = get_tarone_tests_no(min_pvalues, alpha)
+        return min_pvalues <= alpha / tests_no, tests_no
+    return min_pvalues <= alpha, None
+
+
+def calc_hypergeometric_test_batch(
         cluster_dict: dict,
-        full_set_dict: dict,
-        file: str
-) -> dict:
-    go_res = {}
-    all_go = []
-    for prot, goes in cluster_dict.items():
-        all_go += list(goes)
-    all_go = list(set(all_go))
-    for go in all_go:
-        go_res[go] = calc_hypergeometric_single_go_test(
-            cluster_dict,
-            full_set_dict,
-            go,
-            file
-        )
-    return go_res
-
-
-def calc_hypergeometric_single_go_test(
-        cluster: dict,
-        full_set: dict,
-        go: str,
-        file: str
-) -> tuple:
-    # https: // alexlenail.medium.com / understanding - and -implementing - the - hypergeometric - test - in -python - a7db688a7458
-    M = len(set(full_set.keys()))  # liczba wszystkich białek
-    m = get_number_of_all_proteins_for_go(full_set, go)  # liczba wszystkich białek z badanym GO
-    N = len(set(cluster.keys()))  # rozmiar klastra
-    x = get_number_of_all_proteins_for_go(cluster, go)  # liczba białek w klastrze z badanym GO
-    stat = hypergeom.sf(x - 1, M, m, N)
-    logging.info(f"file: {file}, parameters for GO {go}: M={M} m={m} k={N} x={x} stat={stat}")
-    return stat, M, m, N, x
-
-
-def get_number_of_all_proteins_for_go(proteins_go: dict, go: str) -> int:
-    return len(set({i: j for i, j in proteins_go.items() if go in j}))
-
-
-def save_results(
-        output_file: str,
+        annotation_index: AnnotationIndex,
         file: str,
-        result: dict,
-        bonf_correction: float,
-        bh: dict,
+        tail_cache: HypergeomTailCache = None,
+        prune: str = None,
+        alpha: float = 0.05
+) -> HypergeomTestBatch:
+    cluster_go_counts = count_proteins_for_go(cluster_dict)
+    #GO terms are counted from sets, sorted so order of results and s-measure ties do not depend on hash seed
+    go_ids = sorted(cluster_go_counts)
+    m = np.fromiter((annotation_index.get_go_count(go) for go in go_ids), dtype=np.int64, count=len(go_ids))
+    x = np.fromiter((cluster_go_counts[go] for go in go_ids), dtype=np.int64, count=len(go_ids))
+    pruned, correction_tests = 0, None
+    if prune is not None:
+        testable, correction_tests = prune_untestable(annotation_index.proteins_no, m, len(cluster_dict), alpha,
+                                                      prune)
+        pruned = len(go_ids) - int(testable.sum())
+        if pruned:
+            go_ids = [go for go, keep in zip(go_ids, testable.tolist()) if keep]
+            m, x = m[testable], x[testable]
+    batch = HypergeomTestBatch(go_ids, annotation_index.proteins_no, m, len(cluster_dict), x, tail_cache)
+    batch.pruned, batch.correction_tests = pruned, correction_tests
+    logging.info(f"file: {file}, tested {len(batch)} GO terms, pruned {pruned}: M={batch.M} k={batch.N}")
+    return batch
+
+
+RESULT_COLUMNS = ("cluster", "go_id", "pvalue", "all_proteins", "all_proteins_with_go", "cluster_size",
+                  "proteins_with_go_in_cluster", "bonf_correction", "bonf_significant", "bh_pvalue",
+                  "bh_significant")
+
+RESULT_FORMATS = ("tsv", "parquet", "arrow")
+
+
+def get_results_header(alpha: float) -> str:
+    return (f"GBSC cluster\tGO ID\tp-value\tAll proteins\tAll proteins annotated with GO\
+                \tCluster size\tProteins annotated with GO in cluster\tBonferroni corrected p-value\tBonferroni significance results alpha={alpha}\tBenjamini-Hochberg corrected p-value\tBenjamini-Hochberg significance results alpha={alpha}\n")
+
+
+def iter_result_rows(file: str, result: HypergeomTestBatch, bonf_correction: float, bh: tuple):
+    """Rows of enrichment results of one cluster, values in order of RESULT_COLUMNS."""
+    if result:
+        bh_pvalues, bh_test_results = bh
+        for (go, value), bh_pvalue, bh_test_result in zip(result.items(), bh_pvalues.tolist(), bh_test_results.tolist()):
+            yield (file, go, value[0], value[1], value[2], value[3], value[4],
+                   bonf_correction, value[0] < bonf_correction, bh_pvalue, bh_test_result)
+
+
+class ResultSink:
+    """Destination of enrichment results, written cluster by cluster through one open handle.
+
+    With significant_only only rows significant after Bonferroni or
+    Benjamini-Hochberg correction are written.
+    """
+
+    def __init__(self, output_file: str, significant_only: bool = False):
+        self.output_file = output_file
+        self.significant_only = significant_only
+        self.rows_no = 0
+
+    def write(self, file: str, result: HypergeomTestBatch, bonf_correction: float, bh: tuple) -> None:
+        self.write_rows(iter_result_rows(file, result, bonf_correction, bh))
+
+    def write_rows(self, rows: Iterable[tuple]) -> None:
+        if self.significant_only:
+            rows = [row for row in rows if row[8] or row[10]]
+        else:
+            rows = list(rows)
+        if rows:
+            self._write_rows(rows)
+            self.rows_no += len(rows)
+
+    def _write_rows(self, rows: list) -> None:
+        raise NotImplementedError
+
+    def close(self) -> None:
+        pass
+
+
+class TSVResultSink(ResultSink):
+    """Tab separated enrichment_results.csv; header is written when given, otherwise rows are appended."""
+
+    def __init__(self, output_file: str, header: str = None, significant_only: bool = False):
+        super().__init__(output_file, significant_only)
+        self._file = open(output_file, "a" if header is None else "w", buffering=1024 ** 2)
+        if header is not None:
+            self._file.write(header)
+
+    def _write_rows(self, rows: list) -> None:
+        self._file.write("".join("\t".join(map(str, row)) + "\n" for row in rows))
+
+    def close(self) -> None:
+        self._file.close()
+
+
+class ArrowResultSink(ResultSink):
+    """Parquet or Arrow IPC file of enrichment results (requires pyarrow).
+
+    Rows are buffered and written as record batches of batch_size rows.
+    """
+
+    batch_size = 1 << 16
+
+    def __init__(self, output_file: str, file_format: str = "parquet", significant_only: bool = False):
+        super().__init__(output_file, significant_only)
+        try:
+            import pyarrow as pa
+        except ImportError:
+            raise ImportError(f"pyarrow is required to write {file_format} results, install it with pip install pyarrow")
+        self._pa = pa
+        self.schema = pa.schema([
+            ("cluster", pa.string()), ("go_id", pa.string()), ("pvalue", pa.float64()),
+            ("all_proteins", pa.int64()), ("all_proteins_with_go", pa.int64()), ("cluster_size", pa.int64()),
+            ("proteins_with_go_in_cluster", pa.int64()), ("bonf_correction", pa.float64()),
+            ("bonf_significant", pa.bool_()), ("bh_pvalue", pa.float64()), ("bh_significant", pa.bool_()),
+        ])
+        if file_format == "parquet":
+            import pyarrow.parquet as pq
+            self._writer = pq.ParquetWriter(output_file, self.schema)
+        else:
+            import pyarrow.ipc as ipc
+            self._writer = ipc.new_file(output_file, self.schema)
+        self._rows = []
 
-) -> None:
-    # print(correction)
-    with open(output_file, "a") as f:
-        if result:
-            for go, value in result.items():
-                bonf_correction_test_result = value[0] < bonf_correction
-                f.write(
-                    # f"{file}\t{go}\t{value[0]}\t{value[1]}\t{value[2]}\t{value[3]}\t{value[4]}\t{correction}\t{value[0] < correction}\t{bh[go]}\t{goes_nr}\t{value[0] < bh[go]}\t{value[0] < correction and value[0] < bh[go]}\n")
-                    #Asia's version
-                    #f"{file}\t{go}\t{value[0]}\t{value[1]}\t{value[2]}\t{value[3]}\t{value[4]}\t{correction}\t{correction <= alpha}\t{bh[go]}\t{goes_nr}\t{value[0] <= alpha}\n")
-                    #removed goes_nr - number of GO in cluster
-                    f"{file}\t{go}\t{value[0]}\t{value[1]}\t{value[2]}\t{value[3]}\t{value[4]}\t{bonf_correction}\t{bonf_correction_test_result}\t{bh[go][0]}\t{bh[go][1]}\n")
+    def _write_rows(self, rows: list) -> None:
+        self._rows.extend(rows)
+        if len(self._rows) >= self.batch_size:
+            self._flush()
 
+    def _flush(self) -> None:
+        if self._rows:
+            columns = [list(column) for column in zip(*self._rows)]
+            self._writer.write_batch(self._pa.record_batch(columns, schema=self.schema))
+            self._rows = []
+
+    def close(self) -> None:
+        self._flush()
+        self._writer.close()
+
+
+class ListResultSink(ResultSink):
+    """Keeps result rows in memory, e.g. for the pipeline API."""
+
+    def __init__(self, significant_only: bool = False):
+        super().__init__(None, significant_only)
+        self.rows = []
+
+    def _write_rows(self, rows: list) -> None:
+        self.rows.extend(rows)
+
+
+class MultiSink(ResultSink):
+    """Passes the same results to several sinks, e.g. results file and s-measure."""
+
+    def __init__(self, sinks: list):
+        super().__init__(next((sink.output_file for sink in sinks if sink.output_file), None))
+        self.sinks = sinks
+
+    def write(self, file: str, result: HypergeomTestBatch, bonf_correction: float, bh: tuple) -> None:
+        for sink in self.sinks:
+            sink.write(file, result, bonf_correction, bh)
+
+    def write_rows(self, rows: Iterable[tuple]) -> None:
+        rows = list(rows)
+        for sink in self.sinks:
+            sink.write_rows(rows)
+
+    def close(self) -> None:
+        for sink in self.sinks:
+            sink.close()
+
+
+def open_result_sink(output_file: str, alpha: float, file_format: str = "tsv",
+                     significant_only: bool = False) -> ResultSink:
+    if file_format == "tsv":
+        return TSVResultSink(output_file, get_results_header(alpha), significant_only)
+    return ArrowResultSink(output_file, file_format, significant_only)
+
+
+def iter_result_file(file: str) -> Iterable[tuple]:
+    """Reads rows written by any ResultSink, values in order of RESULT_COLUMNS (TSV values stay text)."""
+    if file.endswith((".parquet", ".arrow")):
+        import pyarrow.parquet as pq
+        import pyarrow.ipc as ipc
+        if file.endswith(".parquet"):
+            batches = pq.ParquetFile(file).iter_batches()
+        else:
+            reader = ipc.open_file(file)
+            batches = (reader.get_batch(i) for i in range(reader.num_record_batches))
+        for batch in batches:
+            yield from zip(*(column.to_pylist() for column in batch.columns))
+    else:
+        with open(file) as f:
+            next(f)
+            for line in f:
+                if line.strip():
+                    yield tuple(line.strip().split())
 
-# nazwa pliku;Go name;
-
-def select_go_for_cluster(
-        cluster_proteins: list,
-        all_go: dict
-) -> dict:
-    return {i: j for i, j in all_go.items() if i in cluster_proteins}
 
+# nazwa pliku;Go name;
 
 def save_go(file: str,
             go_set: dict,
@@ -129,78 +483,296 @@ def save_go(file: str,
         raise (stored_exception[0], stored_exception[1], stored_exception[2])
 
 
-def calc_bonferroni_correction(alpha: float, go_clusters: dict) -> tuple:
-    goes = []
-    for go in go_clusters.values():
-        goes += list(go)
-    if len(set(goes)) != 0:
-        return alpha / len(set(goes)), len(set(goes))
-    return 100, len(set(goes))
+def calc_bonferroni_correction(alpha: float, pvals: np.ndarray) -> tuple:
+    # each GO term present in cluster is tested exactly once
+    goes_nr = len(pvals)
+    if goes_nr != 0:
+        return alpha / goes_nr, goes_nr
+    return 100, goes_nr
 
 
-def Benjamini_Hochberg(pvals, significance):
-    pvals_test = list(pvals.values())
-    if pvals_test:
-        # print(pvals_test)
-        rest = multipletests(pvals=[i[0] for i in pvals_test], alpha=significance, method="fdr_bh")
-        # print("rest", rest)
-        new_pvals = {i[0]: (rest[1][e], rest[0][e]) for e, i in enumerate(pvals.items())}
-        return new_pvals
+def Benjamini_Hochberg(pvals: np.ndarray, significance: float) -> tuple:
+    if len(pvals):
+        from statsmodels.stats.multitest import multipletests
+        rest = multipletests(pvals=pvals, alpha=significance, method="fdr_bh")
+        # adjusted p-values and information if test is significant
+        return rest[1], rest[0]
     else:
-        return {}
+        return np.empty(0), np.empty(0, dtype=bool)
+
+
+def calc_corrections(test: HypergeomTestBatch, alfa: float) -> tuple:
+    """Bonferroni threshold and Benjamini-Hochberg results of tests of one cluster."""
+    logging.debug("Running bonferroni correction")
+    bonf_correction, _ = calc_bonferroni_correction(alfa, test.pvalues)
+    if test.correction_tests:
+        #Tarone's factor replaces number of tested terms
+        bonf_correction = alfa / test.correction_tests
+    logging.debug("Running Benjamini-Hochberg corection")
+    return bonf_correction, Benjamini_Hochberg(test.pvalues, alfa)
+
+
+class GlobalCorrection(ResultSink):
+    """Experiment-wide Bonferroni and Benjamini-Hochberg correction across all cluster x GO term tests.
+
+    Rows with per-cluster correction are written to a temporary file and raw
+    p-values are spilled to a float64 file while clusters are tested. close
+    runs one vectorized BH pass over the memory mapped p-values and streams
+    rows with corrected values to sink in a second pass.
+    """
+
+    chunk_size = 1 << 16
+
+    def __init__(self, sink: ResultSink, alpha: float):
+        super().__init__(sink.output_file)
+        self.sink = sink
+        self.alpha = alpha
+        #temporary files are kept next to results file, or in temporary directory for in-memory sinks
+        self._spill_dir = None if sink.output_file else tempfile.mkdtemp(prefix="gbsc_enrichment_")
+        spill_prefix = sink.output_file or os.path.join(self._spill_dir, "enrichment_results")
+        self.cluster_output_file = spill_prefix + ".per_cluster"
+        self.pvalues_file = spill_prefix + ".pvalues"
+        self._rows = TSVResultSink(self.cluster_output_file, header="")
+        self._pvalues = open(self.pvalues_file, "wb")
+        self.tests_no = 0
+
+    def write(self, file: str, result: HypergeomTestBatch, bonf_correction: float, bh: tuple) -> None:
+        if result:
+            self._rows.write(file, result, bonf_correction, bh)
+            self._pvalues.write(np.ascontiguousarray(result.pvalues, dtype=np.float64).tobytes())
+            self.tests_no += len(result)
+
+    def close(self) -> None:
+        with performance.stage("global correction"):
+            self._close()
+
+    def _close(self) -> None:
+        self._rows.close()
+        self._pvalues.close()
+        bonf_correction, _ = calc_bonferroni_correction(self.alpha, range(self.tests_no))
+        if self.tests_no:
+            pvalues = np.memmap(self.pvalues_file, dtype=np.float64, mode="r")
+            bh_pvalues = benjamini_hochberg_adjust(pvalues)
+        else:
+            pvalues = bh_pvalues = np.empty(0)
+        logging.info(f"Global correction of {self.tests_no} tests")
+        with open(self.cluster_output_file) as f:
+            for start in range(0, self.tests_no, self.chunk_size):
+                chunk_pvalues = pvalues[start:start + self.chunk_size].tolist()
+                chunk_bh = bh_pvalues[start:start + self.chunk_size].tolist()
+                rows = []
+                for pvalue, bh_pvalue in zip(chunk_pvalues, chunk_bh):
+                    line = f.readline().rstrip("\n").split("\t")
+                    rows.append((line[0], line[1], pvalue, int(line[3]), int(line[4]), int(line[5]), int(line[6]),
+                                 bonf_correction, pvalue < bonf_correction, bh_pvalue, bh_pvalue <= self.alpha))
+                self.sink.write_rows(rows)
+        del pvalues
+        os.remove(self.cluster_output_file)
+        os.remove(self.pvalues_file)
+        if self._spill_dir is not None:
+            shutil.rmtree(self._spill_dir, ignore_errors=True)
+        self.sink.close()
+        self.rows_no = self.sink.rows_no
+
+
+class SweepSink(ResultSink):
+    """Parameter sweep: raw tests of every cluster are corrected with several alphas.
+
+    sinks maps alpha -> sink of results for that alpha. Tests must be run
+    without pruning and with per-cluster correction, as Tarone's pruning
+    (tarone) and global correction depend on alpha and are applied here for
+    every alpha separately.
+    """
+
+    def __init__(self, sinks: dict, correction: str = "cluster", tarone: bool = False):
+        super().__init__(None)
+        self.prune = ("tarone" if correction == "cluster" else "alpha") if tarone else None
+        self.sinks = {alpha: GlobalCorrection(sink, alpha) if correction == "global" else sink
+                      for alpha, sink in sinks.items()}
+
+    def write(self, file: str, result: HypergeomTestBatch, bonf_correction: float, bh: tuple) -> None:
+        for alpha, sink in self.sinks.items():
+            test, bonf_correction, bh = result, None, None
+            if result is not None:
+                if self.prune is not None:
+                    testable, correction_tests = prune_untestable(result.M, result.m, result.N, alpha, self.prune)
+                    test = result.select(testable)
+                    test.pruned, test.correction_tests = len(result) - len(test), correction_tests
+                bonf_correction, bh = calc_corrections(test, alpha)
+            sink.write(file, test, bonf_correction, bh)
+
+    def close(self) -> None:
+        for sink in self.sinks.values():
+            sink.close()
+
+
+def benjamini_hochberg_adjust(pvalues: np.ndarray) -> np.ndarray:
+    """Benjamini-Hochberg adjusted p-values (as multipletests fdr_bh) using one sort of p-values."""
+    tests_no = len(pvalues)
+    order = np.argsort(pvalues, kind="mergesort")
+    adjusted = np.asarray(pvalues, dtype=np.float64)[order]
+    adjusted *= tests_no / np.arange(1, tests_no + 1, dtype=np.float64)
+    np.minimum.accumulate(adjusted[::-1], out=adjusted[::-1])
+    np.minimum(adjusted, 1, out=adjusted)
+    result = np.empty(tests_no, dtype=np.float64)
+    result[order] = adjusted
+    return result
+
+
+def _init_worker(annotation_index: AnnotationIndex, tail_cache_size: int = 0, prune: str = None) -> None:
+    global _annotation_index, _tail_cache, _prune
+    _annotation_index = annotation_index
+    _tail_cache = HypergeomTailCache(int(tail_cache_size * 1024 ** 2)) if tail_cache_size > 0 else None
+    _prune = prune
 
 
-def run_go_analyse(output_file, go_annotations_file, alpha, folder_clusters):
+def run_go_analyse(output_file, go_annotations_file, alpha, folder_clusters, workers=1, result_cache=None,
+                   correction="cluster", tail_cache_size=0, tarone=False, shard=None, return_results=False):
+    """Tests all clusters; results are written to output_file, a path of TSV file the rows are appended to
+    or a ResultSink, which is closed after the last cluster.
 
-    files = os.listdir(folder_clusters)
+    go_annotations_file is a path of annotation store or JSON file, or AnnotationIndex, and folder_clusters
+    a path of clusters directory, tar archive or multi-cluster FASTA file, or dict cluster name -> accessions.
+
+    tail_cache_size > 0 keeps up to that many MB of hypergeometric tail tables in every process.
+    With tarone GO terms which can not be significant are not tested (see prune_untestable).
+    shard (src.shards.Shard) selects part of clusters tested in this run.
+    With return_results dict cluster name -> rows of get_data_go_results (per-cluster correction)
+    is returned, otherwise None.
+    """
+    prune = ("tarone" if correction == "cluster" else "alpha") if tarone else None
+
+
+    #sorted so that results are written in the same order in every run
+    #clusters are files in directory, or are packed into tar archive or multi-cluster FASTA file,
+    #or are given in memory as cluster name -> accessions
+    if isinstance(folder_clusters, dict):
+        clusters = [(file, list(accessions)) for file, accessions in sorted(folder_clusters.items())]
+    elif os.path.isdir(folder_clusters):
+        clusters = [(file, None) for file in sorted(os.listdir(folder_clusters))]
+    else:
+        clusters = list(read_packed_clusters(folder_clusters))
+    if shard is not None:
+        clusters = shard.select(clusters)
     #print(f"Proteins {len([i for i, j in all_go.items() if not j])} do not have GO")
     
-    #read GO annotations including ancestors for all proteins    
-    with open(go_annotations_file, 'r', encoding='utf-8') as f:
-        all_go = json.load(f)
-
-    result_dict = {}
-    len_files = len(files)
-    runs = []
-    for e, file in enumerate(files):
-        runs.append((file, e, len_files, folder_clusters, all_go, alpha, output_file))
-    
-    #with Pool(100) as p:
-    #    results = p.map(calc, runs)
+    #read GO annotations including ancestors for all proteins (binary store or JSON file) unless index is given
+    if isinstance(go_annotations_file, AnnotationIndex):
+        annotation_index = go_annotations_file
+    else:
+        with performance.stage("annotation load"):
+            annotation_index = AnnotationIndex.load(go_annotations_file)
+
+    sink = TSVResultSink(output_file) if isinstance(output_file, str) else output_file
+    #with global correction rows reach the sink after all clusters are tested,
+    #results returned with return_results keep per-cluster correction
+    if sink is not None and correction == "global":
+        sink = GlobalCorrection(sink, alpha)
+
+    result_dict = {} if return_results else None
+    len_files = len(clusters)
+
+    _init_worker(annotation_index, tail_cache_size, prune)
+    if workers > 1 and clusters:
+        #imported before workers are forked, not again in every worker
+        for module in TEST_MODULES:
+            importlib.import_module(module)
+    #workers get the index once at startup (inherited on fork), results come back
+    #in chunks in the order of files
+    with (Pool(workers, initializer=_init_worker, initargs=(annotation_index, tail_cache_size, prune)) if workers > 1
+          else nullcontext()) as p:
+
+        def run(function, tasks):
+            if p is None:
+                return map(function, tasks)
+            return p.imap(function, tasks, chunksize=max(1, min(100, len(tasks) // (workers * 4))))
+
+        #results of clusters with the same proteins, annotations and alpha are taken from cache,
+        #keys are computed by workers, so cluster files are parsed in parallel
+        cache_keys = [None] * len(clusters)
+        cached = [None] * len(clusters)
+        if result_cache is not None:
+            key_tasks = [(file, folder_clusters, accessions, annotation_index.version, alpha, prune)
+                         for file, accessions in clusters]
+            for e, (accessions, key) in enumerate(run(get_cluster_key, key_tasks)):
+                clusters[e] = (clusters[e][0], accessions)
+                cache_keys[e] = key
+                cached[e] = result_cache.get_result(cache_keys[e])
+
+        runs = []
+        for e, (file, accessions) in enumerate(clusters):
+            if cached[e] is None:
+                runs.append((file, e, len_files, folder_clusters, alpha, accessions))
+        computed = run(calc, runs)
+        for e, (file, accessions) in enumerate(clusters):
+            if cached[e] is not None:
+                arrays, bonf_correction, bh = cached[e]
+                test = HypergeomTestBatch.from_arrays(arrays) if arrays is not None else None
+                result = file, test, bonf_correction, bh
+            else:
+                result = next(computed)
+                if result_cache is not None:
+                    test, bonf_correction, bh = result[1:]
+                    result_cache.put_result(cache_keys[e], (test.to_arrays() if test is not None else None,
+                                                            bonf_correction, bh))
+            performance.count("clusters")
+            performance.count("cached_clusters", int(cached[e] is not None))
+            performance.count("tests", len(result[1]) if result[1] is not None else 0)
+            if prune is not None and result[1] is not None:
+                performance.count("pruned_tests", result[1].pruned)
+            if cached[e] is None and result[1] is not None and tail_cache_size > 0:
+                performance.count("tail_cache_hits", result[1].tail_cache_hits)
+                performance.count("tail_cache_misses", len(result[1]) - result[1].tail_cache_hits)
+            _collect_result(result, sink, result_dict)
+    if sink is not None:
+        sink.close()
+    return result_dict
 
-    results = map(calc, runs)
 
-    for result in results:
-        data_go_results, file, test, bonf_correction, bh = result
+def _collect_result(result, sink, result_dict):
+    file, test, bonf_correction, bh = result
+
+    if sink is not None:
+    #    logging.info(str(result))
+    #    logging.info(str(test))
+        sink.write(file, test, bonf_correction, bh)
+    if result_dict is not None:
+        result_dict[file] = get_data_go_results(file, test, bonf_correction)
+    # print(f"{all_cl} clusters do not have any protein with GO.")
 
-        if output_file:
-        #    logging.info(str(result))
-        #    logging.info(str(test))
-            save_results(output_file, file, test, bonf_correction, bh)
-        result_dict[file] = data_go_results
-        # print(f"{all_cl} clusters do not have any protein with GO.")
-    return result_dict
+
+def get_cluster_key(data):
+    """Accessions of cluster and its key in cluster results cache."""
+    file, folder_clusters, accessions, annotations_version, alpha, prune = data
+    if accessions is None:
+        accessions = list(get_accessions(os.path.join(folder_clusters, file)))
+    return accessions, ClusterResultCache.make_key(accessions, annotations_version, alpha, prune)
 
 
 def calc(data):
-    file, e, len_files, folder_clusters, all_go, alfa, output_file = data
+    file, e, len_files, folder_clusters, alfa, cluster = data
+    annotation_index = _annotation_index
     logging.info(f"Starting calculations for {file} {e}/{len_files}")
-    cluster_file = os.path.join(folder_clusters, file)
-    cluster = get_proteins(open(cluster_file))
-    logging.info('Selecting GO info for protein cluster')
-    cluster = [i.get_acc() for i in cluster]
-    cluster_go = select_go_for_cluster(cluster, all_go)
-    data_go_results = []
-    test, bonf_correction, bh, goes_nr = None, None, None, None
+    if cluster is None:
+        cluster = list(get_accessions(os.path.join(folder_clusters, file)))
+    logging.debug('Selecting GO info for protein cluster')
+    cluster_go = annotation_index.select_cluster(cluster)
+    test, bonf_correction, bh = None, None, None
     if cluster_go:
         # print(cluster_go)
-        logging.info("Running hypergeometric test")
-        test = calc_hypergeometric_test(cluster_go, all_go, file)
-        logging.info("Running bonferroni correction")
-        bonf_correction, goes_nr = calc_bonferroni_correction(alfa, cluster_go)
-        logging.info("Running Benjamini-Hochberg corection")
-        bh = Benjamini_Hochberg(test, alfa)
-        logging.info("Writing results to file")
+        logging.debug("Running hypergeometric test")
+        test = calc_hypergeometric_test_batch(cluster_go, annotation_index, file, _tail_cache, _prune, alfa)
+        bonf_correction, bh = calc_corrections(test, alfa)
+        logging.debug("Writing results to file")
+    else:
+        logging.info(f"No GO for cluster {file}")
+
+    return file, test, bonf_correction, bh
+
+
+def get_data_go_results(file, test, bonf_correction):
+    data_go_results = []
+    if test is not None:
         for go, value in test.items():
             data_go = dict(
                 go=go,
@@ -229,14 +801,10 @@ def calc(data):
                 go=None,
             )])
     else:
-        logging.info(f"No GO for cluster {file}")
         if not data_go_results:
             data_go_results.append(dict(
                 cluster=file,
                 sinificance_test=None,
                 go=None,
             ))
-
-    return data_go_results, file, test, bonf_correction, bh
-
-
+    return data_go_results
@@ -0,0 +1,88 @@
+"""
+GBSC Clusters GO Ontology Functional Analysis Pipeline
+=======================================================
+
+Persistent SQLite cache of QuickGO responses, so re-running 01_download_go.py
+for the same proteins (e.g. with other --exclude_IEA or --aspect) does not
+download the same data again.
+
+Author: Aleksandra Gruca (2026)
+"""
+
+import json
+import logging
+import time
+
+import requests
+
+from src import performance
+from src.sqlite_cache import SQLiteCache
+
+
+class CachedResponse:
+    """Minimal stand-in for requests.Response used by the download functions."""
+
+    def __init__(self, url: str, status_code: int, text: str):
+        self.url = url
+        self.status_code = status_code
+        self.text = text
+
+    def json(self):
+        return json.loads(self.text)
+
+    def __bool__(self):
+        return self.status_code < 400
+
+    def __repr__(self):
+        return f"<CachedResponse [{self.status_code}]>"
+
+
+class ResponseCache(SQLiteCache):
+    """QuickGO responses keyed by endpoint and parameters, with TTL and LRU eviction by size."""
+
+    name = "QuickGO cache"
+
+    def __init__(self, cache_file: str, ttl: float = 30 * 24 * 3600, max_size: int = 1024 ** 3):
+        super().__init__(cache_file, ttl=ttl, max_size=max_size)
+
+    @staticmethod
+    def make_key(url: str, headers: dict = None) -> str:
+        accept = (headers or {}).get("Accept", "")
+        return f"{accept}|{url}"
+
+    def get(self, key: str):
+        value = super().get(key)
+        if value is None:
+            return None
+        status, body = json.loads(value)
+        return status, body
+
+    def put(self, key: str, status: int, body: str) -> None:
+        super().put(key, json.dumps([status, body]).encode("utf-8"))
+
+
+def cached_get(cache, url: str, headers: dict = None, timeout: float = None, session=None, rate_limiter=None):
+    """requests.get going through cache; only successful (200) responses are stored.
+
+    session (requests.Session) is used instead of requests module when given and
+    rate_limiter is waited on only before requests that really go to the network.
+    """
+    if cache is not None:
+        key = cache.make_key(url, headers)
+        cached = cache.get(key)
+        if cached is not None:
+            logging.info(f"Cached response for {url}")
+            performance.count("http_cache_hits")
+            return CachedResponse(url, *cached)
+    if rate_limiter is not None:
+        rate_limiter.wait()
+    start = time.perf_counter()
+    try:
+        response = (session or requests).get(url, headers=headers, timeout=timeout)
+    except requests.RequestException as err:
+        performance.add_request(time.perf_counter() - start, type(err).__name__)
+        raise
+    performance.add_request(time.perf_counter() - start, response.status_code)
+    if cache is not None and response.status_code == 200:
+        cache.put(key, response.status_code, response.text)
+    return response
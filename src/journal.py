@@ -0,0 +1,86 @@
+"""
+GBSC Clusters GO Ontology Functional Analysis Pipeline
+=======================================================
+
+Checkpoint journal of 01_download_go.py. Every completed batch of annotations,
+ancestors and GO term information is appended as one JSON line, so an
+interrupted download can be resumed and new proteins can be added to an
+existing output directory without downloading everything again.
+
+Author: Aleksandra Gruca (2026)
+"""
+
+import json
+import logging
+import os
+
+
+class DownloadJournal:
+    """Append-only JSON lines journal of downloaded QuickGO data.
+
+    annotations maps protein accession to its direct GO terms ([] for proteins
+    without annotations), ancestors maps GO ID to all its ancestors as returned
+    by QuickGO and terms maps GO ID to (name, aspect). Annotations depend on
+    aspect and evidence filters, so they are reused only if settings stored in
+    the journal header match settings of the current run.
+    """
+
+    def __init__(self, journal_file: str, settings: dict, resume: bool = False):
+        self.journal_file = journal_file
+        self.settings = settings
+        self.annotations = {}
+        self.ancestors = {}
+        self.terms = {}
+        mode = "w"
+        if resume and os.path.exists(journal_file):
+            self._load()
+            mode = "a"
+        self._file = open(journal_file, mode, encoding="utf-8")
+        if mode == "a" and self._file.tell() and not self._ends_with_newline():
+            self._file.write("\n")
+        self._write(dict(type="settings", settings=settings))
+
+    def _load(self) -> None:
+        same_settings = True
+        with open(self.journal_file, encoding="utf-8") as f:
+            for line in f:
+                try:
+                    record = json.loads(line)
+                except json.JSONDecodeError:
+                    # last line may be cut if previous run was interrupted while writing
+                    logging.info(f"Skipping broken line in journal {self.journal_file}")
+                    continue
+                if record["type"] == "settings":
+                    same_settings = record["settings"] == self.settings
+                elif record["type"] == "annotations" and same_settings:
+                    self.annotations.update(record["data"])
+                elif record["type"] == "ancestors":
+                    self.ancestors.update(record["data"])
+                elif record["type"] == "terms":
+                    self.terms.update({go: tuple(term) for go, term in record["data"].items()})
+        print(f"Journal {self.journal_file}: {len(self.annotations)} proteins, "
+              f"{len(self.ancestors)} GO ancestors, {len(self.terms)} GO terms already downloaded")
+
+    def _ends_with_newline(self) -> bool:
+        with open(self.journal_file, "rb") as f:
+            f.seek(-1, os.SEEK_END)
+            return f.read(1) == b"\n"
+
+    def _write(self, record: dict) -> None:
+        self._file.write(json.dumps(record) + "\n")
+        self._file.flush()
+
+    def add_annotations(self, annotations: dict) -> None:
+        self.annotations.update(annotations)
+        self._write(dict(type="annotations", data=annotations))
+
+    def add_ancestors(self, ancestors: dict) -> None:
+        self.ancestors.update(ancestors)
+        self._write(dict(type="ancestors", data=ancestors))
+
+    def add_terms(self, terms: dict) -> None:
+        self.terms.update(terms)
+        self._write(dict(type="terms", data=terms))
+
+    def close(self) -> None:
+        self._file.close()
@@ -0,0 +1,161 @@
+"""
+GBSC Clusters GO Ontology Functional Analysis Pipeline
+=======================================================
+
+Offline GO ontology read from OBO file (e.g. go-basic.obo), used in place of
+QuickGO ontology requests for ancestors, aspects and names of GO terms.
+
+Author: Aleksandra Gruca (2026)
+"""
+
+import logging
+from typing import Iterable
+
+from src.utils import open_text_file
+
+# relations followed by QuickGO ancestors request used in 01_download_go.get_ancestors
+DEFAULT_RELATIONS = ("is_a", "part_of", "occurs_in", "regulates")
+
+ASPECT_DICT = dict(F="molecular_function",
+                   P="biological_process",
+                   C="cellular_component")
+
+#value of --aspect selecting all three aspects in one run
+ALL_ASPECTS = "all"
+
+
+def get_aspect_keys(aspects: Iterable[str]) -> dict:
+    """Maps aspect as written in annotations (e.g. F or molecular_function) to requested aspect."""
+    keys = {}
+    for aspect in aspects:
+        keys[aspect] = aspect
+        if aspect in ASPECT_DICT:
+            keys[ASPECT_DICT[aspect]] = aspect
+    return keys
+
+
+class GeneOntology:
+    """GO terms and relations between them kept in memory as a DAG.
+
+    parents maps GO ID to GO IDs it is directly connected to by one of the
+    followed relations. Ancestor closures are memoized, so computing ancestors
+    for all terms visits every edge of the DAG only once.
+    """
+
+    def __init__(self, relations: Iterable[str] = DEFAULT_RELATIONS):
+        self.relations = set(relations)
+        self.names = {}
+        self.aspects = {}
+        self.parents = {}
+        self.alt_ids = {}
+        self._closure = {}
+
+    def add_term(self, go_id: str, name: str, aspect: str, parents: list, alt_ids: list) -> None:
+        self.names[go_id] = name
+        self.aspects[go_id] = aspect
+        self.parents[go_id] = tuple(parents)
+        for alt_id in alt_ids:
+            self.alt_ids[alt_id] = go_id
+
+    def primary_id(self, go: str) -> str:
+        return self.alt_ids.get(go, go)
+
+    def __contains__(self, go: str) -> bool:
+        return self.primary_id(go) in self.parents
+
+    def get_name(self, go: str):
+        return self.names.get(self.primary_id(go))
+
+    def get_aspect(self, go: str):
+        return self.aspects.get(self.primary_id(go))
+
+    def get_ancestors(self, go: str) -> frozenset:
+        go = self.primary_id(go)
+        if go in self._closure:
+            return self._closure[go]
+        # iterative post-order walk, so deep branches do not hit recursion limit
+        stack = [(go, False)]
+        while stack:
+            term, expanded = stack.pop()
+            if term in self._closure:
+                continue
+            parents = self.parents.get(term, ())
+            if expanded:
+                closure = set(parents)
+                for parent in parents:
+                    closure |= self._closure.get(parent, frozenset())
+                closure.discard(term)
+                self._closure[term] = frozenset(closure)
+            else:
+                stack.append((term, True))
+                stack.extend((parent, False) for parent in parents if parent not in self._closure)
+        return self._closure[go]
+
+    def is_aspect(self, go: str, aspect: str) -> bool:
+        aspect_go = self.get_aspect(go)
+        return aspect_go is not None and (aspect_go == aspect or aspect_go == ASPECT_DICT.get(aspect))
+
+    def get_ancestors_for_aspect(
+            self,
+            go_list: Iterable[str],
+            all_go: set,
+            aspect: str
+    ) -> (dict, set):
+        """Offline counterpart of 01_download_go.get_ancestors with the same results layout."""
+        ancestors = {}
+        all_go = set(all_go)
+        for go in go_list:
+            if go not in self:
+                logging.info(f"Lack of GO ancestor info for {go} in ontology file")
+                ancestors[go] = []
+                continue
+            ancestors[go] = [i for i in self.get_ancestors(go)
+                             if i != go and (i in all_go or self.is_aspect(i, aspect))]
+            all_go.update(ancestors[go])
+        return ancestors, all_go
+
+    def save_names(self, go_ids: Iterable[str], save_file: str) -> None:
+        """Offline counterpart of 01_download_go.fill_names."""
+        with open(save_file, "a") as f:
+            for go_id in go_ids:
+                go_name = self.get_name(go_id)
+                if go_name is None:
+                    logging.info(f"Lack of GO name for {go_id} in ontology file")
+                    continue
+                f.write(f"{go_id}\t{go_name}\t{self.get_aspect(go_id)}\n")
+
+
+def read_obo(file: str, relations: Iterable[str] = DEFAULT_RELATIONS) -> GeneOntology:
+    ontology = GeneOntology(relations)
+    term = None
+
+    def add(term):
+        if term is not None and term.get("id"):
+            ontology.add_term(term["id"], term.get("name"), term.get("namespace"),
+                              term["parents"], term["alt_ids"])
+
+    with open_text_file(file) as f:
+        for line in f:
+            line = line.strip()
+            if line.startswith("["):
+                add(term)
+                term = dict(parents=[], alt_ids=[]) if line == "[Term]" else None
+                continue
+            if term is None or ":" not in line:
+                continue
+            key, value = line.split(":", 1)
+            value = value.strip()
+            if key in ("id", "name", "namespace"):
+                term[key] = value
+            elif key == "alt_id":
+                term["alt_ids"].append(value)
+            # trailing comment is dropped, e.g. "is_a: GO:0003674 ! molecular_function"
+            elif key == "is_a" and "is_a" in ontology.relations:
+                term["parents"].append(value.split()[0])
+            elif key == "relationship":
+                relation, target = value.split()[:2]
+                if relation in ontology.relations:
+                    term["parents"].append(target)
+        add(term)
+    logging.info(f"Read {len(ontology.parents)} GO terms from {file}")
+    return ontology
@@ -0,0 +1,121 @@
+"""
+GBSC Clusters GO Ontology Functional Analysis Pipeline
+=======================================================
+
+Performance report of pipeline runs: wall time of stages, counters, rates,
+QuickGO request latencies and peak memory, saved as JSON at the end of every
+run of 01_download_go.py and 02_gbsc_functional_analysis.py.
+
+Author: Aleksandra Gruca (2026)
+"""
+
+import json
+import sys
+import threading
+import time
+from contextlib import contextmanager, nullcontext
+
+try:
+    import resource
+except ImportError:  # not available on Windows
+    resource = None
+
+
+#report of the current run, set by start_report in main of both scripts; None - nothing is collected
+report = None
+
+
+class PerformanceReport:
+    """Stage timings, counters and HTTP request latencies of one run.
+
+    Counters are updated in the main process (and its download threads) only,
+    results of pool workers are counted when they are collected.
+    """
+
+    def __init__(self, name: str):
+        self.name = name
+        self.started = time.time()
+        self._start = time.perf_counter()
+        self.stages = {}
+        self.counters = {}
+        self.rates = {}
+        self.http_latencies = []
+        self.http_status_codes = {}
+        self._lock = threading.Lock()
+
+    @contextmanager
+    def stage(self, name: str):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.stages[name] = self.stages.get(name, 0.0) + time.perf_counter() - start
+
+    def count(self, name: str, value: int = 1) -> None:
+        with self._lock:
+            self.counters[name] = self.counters.get(name, 0) + value
+
+    def add_rate(self, name: str, counter: str, stage: str) -> None:
+        """Reports name as counter per second of stage wall time, e.g. tests per second of enrichment."""
+        self.rates[name] = (counter, stage)
+
+    def add_request(self, latency: float, status_code) -> None:
+        with self._lock:
+            self.http_latencies.append(latency)
+            key = str(status_code)
+            self.http_status_codes[key] = self.http_status_codes.get(key, 0) + 1
+
+    def to_dict(self) -> dict:
+        rates = {}
+        for name, (counter, stage) in self.rates.items():
+            if self.stages.get(stage):
+                rates[name] = self.counters.get(counter, 0) / self.stages[stage]
+        http = dict(requests=len(self.http_latencies), status_codes=self.http_status_codes)
+        if self.http_latencies:
+            latencies = sorted(self.http_latencies)
+            http.update(latency_mean=sum(latencies) / len(latencies),
+                        latency_p50=latencies[len(latencies) // 2],
+                        latency_p95=latencies[min(len(latencies) - 1, int(len(latencies) * 0.95))],
+                        latency_max=latencies[-1])
+        return dict(name=self.name,
+                    started=time.strftime("%Y-%m-%dT%H:%M:%S", time.localtime(self.started)),
+                    wall_time=time.perf_counter() - self._start,
+                    stages=self.stages,
+                    counters=self.counters,
+                    rates=rates,
+                    http=http,
+                    peak_rss_mb=get_peak_rss_mb(),
+                    peak_rss_children_mb=get_peak_rss_mb(children=True))
+
+    def save(self, file: str) -> None:
+        with open(file, "w", encoding="utf-8") as f:
+            json.dump(self.to_dict(), f, indent=4)
+
+
+def get_peak_rss_mb(children: bool = False):
+    """Peak resident memory of this process (or of its largest finished child, e.g. pool worker) in MB."""
+    if resource is None:
+        return None
+    usage = resource.getrusage(resource.RUSAGE_CHILDREN if children else resource.RUSAGE_SELF)
+    # ru_maxrss is in bytes on macOS and in kilobytes elsewhere
+    return usage.ru_maxrss / (1024 ** 2 if sys.platform == "darwin" else 1024)
+
+
+def start_report(name: str) -> PerformanceReport:
+    global report
+    report = PerformanceReport(name)
+    return report
+
+
+def stage(name: str):
+    return report.stage(name) if report is not None else nullcontext()
+
+
+def count(name: str, value: int = 1) -> None:
+    if report is not None:
+        report.count(name, value)
+
+
+def add_request(latency: float, status_code) -> None:
+    if report is not None:
+        report.add_request(latency, status_code)
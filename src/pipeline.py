@@ -0,0 +1,278 @@
+"""
+GBSC Clusters GO Ontology Functional Analysis Pipeline
+=======================================================
+
+Pipeline API for notebooks and workflow engines. Annotation acquisition,
+clusters enrichment and s-measure are in-memory stages, so results are not
+written and parsed back between them as with 01_download_go.py and
+02_gbsc_functional_analysis.py. Files of both scripts are optional outputs.
+
+    from src.pipeline import run_all
+
+    result = run_all(proteins, "input/clusters_acc", aspect="F", output_dir="results")
+    for cluster, cluster_size, s_value, go, go_name in result.s_values:
+        ...
+
+Stages can be used separately: acquire_annotations (or GOAnnotations.load of
+an existing output directory), run_enrichment and compute_s_measure.
+acquire_annotations_aspects gets annotations of several aspects from one
+download.
+
+Author: Aleksandra Gruca (2026)
+"""
+
+import json
+import os
+from typing import Iterable
+
+from src import annotations
+from src.analyse_clusters import AnaliseCluster, SMeasureSink, save_s_values
+from src.annotation_files import get_GO_from_file_aspects
+from src.annotation_store import is_annotation_store, iter_annotation_store, write_annotation_store
+from src.downloader import QUICKGO_URL
+from src.go_analise import (AnnotationIndex, ListResultSink, MultiSink, ResultSink, open_result_sink,
+                            run_go_analyse)
+from src.ontology import ASPECT_DICT, read_obo
+from src.utils import (ENRICHMENT_RESULTS_FILES, GO_ANNOTATIONS_FILE, GO_ANNOTATIONS_STORE, GO_NAMES_FILE,
+                       S_VALUES_FILE, get_annotations_file, read_clusters)
+
+
+class GOAnnotations:
+    """GO annotations of proteins including ancestors, and names of GO terms.
+
+    protein_go maps protein accession to sorted GO terms (only annotated
+    proteins) and names maps GO ID to (name, aspect).
+    """
+
+    def __init__(self, protein_go: dict, names: dict, aspect: str = None):
+        self.protein_go = protein_go
+        self.names = names
+        self.aspect = aspect
+        self._index = None
+
+    def get_index(self) -> AnnotationIndex:
+        if self._index is None:
+            self._index = AnnotationIndex.from_dict(self.protein_go)
+        return self._index
+
+    def get_names(self) -> dict:
+        return {go: name for go, (name, aspect) in self.names.items()}
+
+    def save(self, output_dir: str, annotation_format: str = "both") -> None:
+        """Writes files of 01_download_go.py: annotations JSON and/or store and GO names."""
+        os.makedirs(output_dir, exist_ok=True)
+        if annotation_format != "store":
+            annotations.write_annotation_json(self.protein_go.items(), os.path.join(output_dir, GO_ANNOTATIONS_FILE))
+        if annotation_format != "json":
+            write_annotation_store(self.protein_go.items(), os.path.join(output_dir, GO_ANNOTATIONS_STORE))
+        with open(os.path.join(output_dir, GO_NAMES_FILE), "w") as f:
+            for go, (name, aspect) in self.names.items():
+                f.write(f"{go}\t{name}\t{aspect}\n")
+
+    @classmethod
+    def load(cls, output_dir: str) -> "GOAnnotations":
+        """Reads output directory of 01_download_go.py; store or JSON file is chosen as by 02 script."""
+        go_annotations_file = get_annotations_file(output_dir)
+        if is_annotation_store(go_annotations_file):
+            protein_go = dict(iter_annotation_store(go_annotations_file))
+        elif os.path.exists(go_annotations_file):
+            with open(go_annotations_file, encoding="utf-8") as f:
+                protein_go = json.load(f)
+        else:
+            raise FileNotFoundError(f"No GO annotations in {output_dir}, run 01_download_go.py first")
+        names = {}
+        names_file = os.path.join(output_dir, GO_NAMES_FILE)
+        if os.path.exists(names_file):
+            with open(names_file) as f:
+                for line in f:
+                    parts = line.rstrip("\n").split("\t")
+                    if len(parts) >= 2 and not parts[0].startswith("#"):
+                        names[parts[0]] = (parts[1], parts[2] if len(parts) > 2 else None)
+        return cls(protein_go, names)
+
+
+class PipelineResult:
+    """Results of run_all: annotations, s-measure of clusters and, if kept, all enrichment result rows."""
+
+    def __init__(self, go_annotations: GOAnnotations, s_values: list, results: list = None):
+        self.go_annotations = go_annotations
+        self.s_values = s_values
+        self.results = results
+
+
+def acquire_annotations(
+        proteins: Iterable[str],
+        aspect: str = "F",
+        exclude_IEA: bool = False,
+        ontology=None,
+        annotation_file: str = None,
+        base_url: str = QUICKGO_URL,
+        workers: int = 4,
+        requests_per_second: float = 10,
+        max_retries: int = 5,
+        cache=None,
+) -> GOAnnotations:
+    """Direct GO annotations of proteins with ancestors within aspect and names of GO terms.
+
+    Annotations come from QuickGO or from local GAF/GPAD annotation_file, and
+    ancestors and names from QuickGO or from ontology (GeneOntology or path of
+    OBO file). cache is ResponseCache used for QuickGO requests.
+    """
+    return acquire_annotations_aspects(proteins, (aspect,), exclude_IEA=exclude_IEA, ontology=ontology,
+                                       annotation_file=annotation_file, base_url=base_url, workers=workers,
+                                       requests_per_second=requests_per_second, max_retries=max_retries,
+                                       cache=cache)[aspect]
+
+
+def acquire_annotations_aspects(
+        proteins: Iterable[str],
+        aspects: Iterable[str] = ASPECT_DICT,
+        exclude_IEA: bool = False,
+        ontology=None,
+        annotation_file: str = None,
+        base_url: str = QUICKGO_URL,
+        workers: int = 4,
+        requests_per_second: float = 10,
+        max_retries: int = 5,
+        cache=None,
+) -> dict:
+    """acquire_annotations for several aspects from one download; returns aspect -> GOAnnotations."""
+    proteins = list(proteins)
+    aspects = list(aspects)
+    exclude = ["IEA"] if exclude_IEA else []
+    if isinstance(ontology, str):
+        if not os.path.isfile(ontology):
+            raise FileNotFoundError(f"GO ontology file {ontology} does not exist")
+        ontology = read_obo(ontology)
+    if annotation_file and not os.path.isfile(annotation_file):
+        raise FileNotFoundError(f"GO annotation file {annotation_file} does not exist")
+
+    previous_cache = annotations.response_cache
+    annotations.response_cache = cache
+    try:
+        if annotation_file:
+            aspect_results = get_GO_from_file_aspects(annotation_file, protein_list=proteins, exclude=exclude,
+                                                      aspects=aspects, ontology=ontology)
+        else:
+            aspect_results = annotations.get_GO_aspects(
+                proteins, exclude=exclude, aspects=aspects, workers=workers,
+                requests_per_second=requests_per_second, max_retries=max_retries, base_url=base_url)
+
+        go_lists = {aspect: {go for goes in proteins_go.values() for go in goes}
+                    for aspect, (proteins_go, all_go, protein_go_dict) in aspect_results.items()}
+        all_gos = {aspect: all_go for aspect, (proteins_go, all_go, protein_go_dict) in aspect_results.items()}
+        if ontology is not None:
+            aspect_ancestors = {aspect: ontology.get_ancestors_for_aspect(go_lists[aspect], all_go=all_gos[aspect],
+                                                                          aspect=aspect)
+                                for aspect in aspects}
+            names = {go: (ontology.get_name(go), ontology.get_aspect(go))
+                     for ancestors, all_go in aspect_ancestors.values()
+                     for go in all_go if ontology.get_name(go) is not None}
+        else:
+            aspect_ancestors = annotations.get_ancestors_aspects(go_lists, all_gos, base_url=base_url)
+            names = annotations.get_names(set().union(*(all_go for ancestors, all_go in aspect_ancestors.values())),
+                                          base_url=base_url)
+    finally:
+        annotations.response_cache = previous_cache
+
+    results = {}
+    for aspect, (ancestors, all_go) in aspect_ancestors.items():
+        protein_go_dict = aspect_results[aspect][2]
+        results[aspect] = GOAnnotations(annotations.add_ancestors(ancestors, protein_go_dict),
+                                        {go: names[go] for go in all_go if go in names}, aspect)
+    return results
+
+
+def _get_annotation_index(go_annotations):
+    if isinstance(go_annotations, GOAnnotations):
+        return go_annotations.get_index()
+    return go_annotations
+
+
+def run_enrichment(
+        go_annotations,
+        clusters,
+        alpha: float = 0.05,
+        sinks: Iterable[ResultSink] = (),
+        keep_results: bool = True,
+        workers: int = 1,
+        correction: str = "cluster",
+        tail_cache_size: float = 64,
+        tarone: bool = False,
+        result_cache=None,
+) -> list:
+    """Tests all clusters and returns result rows (in order of go_analise.RESULT_COLUMNS).
+
+    go_annotations is GOAnnotations, AnnotationIndex or path of annotation store
+    or JSON file; clusters is a path (directory, tar archive or multi-cluster
+    FASTA file) or dict cluster name -> accessions. Rows are also passed to
+    sinks, e.g. results file or SMeasureSink; with keep_results=False only
+    sinks get them and an empty list is returned.
+    """
+    sinks = list(sinks)
+    kept = ListResultSink() if keep_results else None
+    if kept is not None:
+        sinks.append(kept)
+    run_go_analyse(MultiSink(sinks), _get_annotation_index(go_annotations), alpha, clusters, workers=workers,
+                   result_cache=result_cache, correction=correction, tail_cache_size=tail_cache_size,
+                   tarone=tarone)
+    return kept.rows if kept is not None else []
+
+
+def compute_s_measure(results: Iterable[tuple], go_names: dict = None) -> list:
+    """s-measure of clusters from result rows of run_enrichment.
+
+    Returns (cluster, cluster size, s-measure, main GO ID, main GO name) sorted
+    by s-measure; go_names maps GO ID to name (GOAnnotations.get_names).
+    """
+    analyse_cluster = AnaliseCluster(None, "0")
+    sink = SMeasureSink(analyse_cluster)
+    sink.write_rows(results)
+    analyse_cluster.count_c()
+    return analyse_cluster.get_s_values(go_names)
+
+
+def run_all(
+        proteins,
+        clusters,
+        aspect: str = "F",
+        alpha: float = 0.05,
+        output_dir: str = None,
+        go_annotations: GOAnnotations = None,
+        keep_results: bool = False,
+        results_format: str = "tsv",
+        significant_only: bool = False,
+        annotation_format: str = "both",
+        workers: int = 1,
+        correction: str = "cluster",
+        tail_cache_size: float = 64,
+        tarone: bool = False,
+        **acquire_options
+) -> PipelineResult:
+    """Annotation acquisition, enrichment and s-measure in one process.
+
+    proteins are accessions to annotate (None to use all cluster proteins) and
+    acquire_options are passed to acquire_annotations; go_annotations skips
+    acquisition. s-measure is computed while clusters are tested. With
+    output_dir the files of both scripts are written there as well.
+    """
+    if go_annotations is None:
+        if proteins is None:
+            proteins = sorted({acc for accessions in read_clusters(clusters).values() for acc in accessions})
+        go_annotations = acquire_annotations(proteins, aspect=aspect, **acquire_options)
+
+    analyse_cluster = AnaliseCluster(None, "0")
+    sinks = [SMeasureSink(analyse_cluster)]
+    if output_dir is not None:
+        go_annotations.save(output_dir, annotation_format)
+        results_file = os.path.join(output_dir, ENRICHMENT_RESULTS_FILES[results_format])
+        sinks.insert(0, open_result_sink(results_file, alpha, results_format, significant_only))
+
+    results = run_enrichment(go_annotations, clusters, alpha, sinks=sinks, keep_results=keep_results,
+                             workers=workers, correction=correction, tail_cache_size=tail_cache_size, tarone=tarone)
+    analyse_cluster.count_c()
+    s_values = analyse_cluster.get_s_values(go_annotations.get_names())
+    if output_dir is not None:
+        save_s_values(os.path.join(output_dir, S_VALUES_FILE), s_values)
+    return PipelineResult(go_annotations, s_values, results if keep_results else None)
+
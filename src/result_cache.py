@@ -0,0 +1,49 @@
+"""
+GBSC Clusters GO Ontology Functional Analysis Pipeline
+=======================================================
+
+Cache of per-cluster enrichment results. Clusters are identified by content,
+so after re-clustering with other GBSC parameters only new or changed clusters
+are tested again.
+
+Author: Aleksandra Gruca (2026)
+"""
+
+import hashlib
+import logging
+import pickle
+from typing import Iterable
+
+from src.sqlite_cache import SQLiteCache
+
+# stored results are plain tuples and numpy arrays (see HypergeomTestBatch.to_arrays), version is
+# a part of every key, so results of other versions are not read after their layout or order changes
+RESULT_FORMAT_VERSION = 2
+
+
+class ClusterResultCache(SQLiteCache):
+    """Results of calc keyed by sorted accessions of cluster, annotations version, alpha and pruning mode."""
+
+    name = "Cluster results cache"
+
+    @staticmethod
+    def make_key(accessions: Iterable[str], annotations_version: str, alpha: float, prune: str = None) -> str:
+        cluster_hash = hashlib.sha256("\n".join(sorted(set(accessions))).encode("utf-8")).hexdigest()
+        key = f"v{RESULT_FORMAT_VERSION}|{cluster_hash}|{annotations_version}|{alpha!r}"
+        return f"{key}|{prune}" if prune else key
+
+    def get_result(self, key: str):
+        value = self.get(key)
+        if value is None:
+            return None
+        try:
+            return pickle.loads(value)
+        except Exception as err:
+            #result which can not be read is tested again and replaced
+            logging.info(f"Cached result {key} can not be read: {err}")
+            self.hits -= 1
+            self.misses += 1
+            return None
+
+    def put_result(self, key: str, result: tuple) -> None:
+        self.put(key, pickle.dumps(result, protocol=pickle.HIGHEST_PROTOCOL))
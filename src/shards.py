@@ -0,0 +1,150 @@
+"""
+GBSC Clusters GO Ontology Functional Analysis Pipeline
+=======================================================
+
+Sharded execution of clusters analysis. Clusters are split into N shards by
+stable hash of cluster name, so batch jobs running
+02_gbsc_functional_analysis.py --shard i/N on many nodes test disjoint parts
+of clusters. Every shard writes its results and a manifest to its shard
+directory; merge_shards checks that manifests of all shards are present and
+that every cluster was tested exactly once, then combines the results.
+
+Author: Aleksandra Gruca (2026)
+"""
+
+import glob
+import hashlib
+import heapq
+import itertools
+import json
+import os
+from collections import Counter
+
+from src.analyse_clusters import read_s_values, save_s_values
+from src.go_analise import iter_result_file, open_result_sink
+
+SHARDS_DIR = "shards"
+MANIFEST_FILE = "manifest.json"
+
+
+def get_shard_no(cluster: str, shards_no: int) -> int:
+    #sha256 instead of hash(), which differs between processes
+    return int.from_bytes(hashlib.sha256(cluster.encode("utf-8")).digest()[:8], "big") % shards_no
+
+
+def get_clusters_digest(clusters) -> str:
+    return hashlib.sha256("\n".join(sorted(clusters)).encode("utf-8")).hexdigest()
+
+
+class Shard:
+    """Shard index (from 0) of count shards of clusters.
+
+    select keeps clusters of this shard and records number and digest of all
+    clusters of the input, so merge_shards can check that shards cover them.
+    """
+
+    def __init__(self, index: int, count: int):
+        if not 0 <= index < count:
+            raise ValueError(f"Shard {index}/{count} out of range, expected i/N with 0 <= i < N")
+        self.index = index
+        self.count = count
+        self.clusters = []
+        self.clusters_total = 0
+        self.clusters_digest = None
+
+    @classmethod
+    def parse(cls, shard: str) -> "Shard":
+        """Shard from i/N string, e.g. 0/4."""
+        try:
+            index, count = (int(i) for i in shard.split("/"))
+        except ValueError:
+            raise ValueError(f"Shard {shard} should be given as i/N, e.g. 0/4")
+        return cls(index, count)
+
+    def __str__(self):
+        return f"{self.index}/{self.count}"
+
+    def get_dir(self, output_dir: str) -> str:
+        return os.path.join(output_dir, SHARDS_DIR, f"shard_{self.index}_of_{self.count}")
+
+    def select(self, clusters: list) -> list:
+        """Clusters of this shard from (cluster name, accessions) pairs of all clusters."""
+        self.clusters_total = len(clusters)
+        self.clusters_digest = get_clusters_digest(name for name, accessions in clusters)
+        selected = [cluster for cluster in clusters if get_shard_no(cluster[0], self.count) == self.index]
+        self.clusters = [name for name, accessions in selected]
+        return selected
+
+    def write_manifest(self, shard_dir: str, settings: dict, files: dict) -> None:
+        """Written after all results of shard, so only completed shards have manifest."""
+        manifest = dict(shard=self.index, shards=self.count, settings=settings, files=files,
+                        clusters_total=self.clusters_total, clusters_digest=self.clusters_digest,
+                        clusters=self.clusters)
+        manifest_file = os.path.join(shard_dir, MANIFEST_FILE)
+        with open(manifest_file + ".tmp", "w", encoding="utf-8") as f:
+            json.dump(manifest, f, indent=4)
+        os.replace(manifest_file + ".tmp", manifest_file)
+
+
+def read_manifests(output_dir: str) -> list:
+    manifests = []
+    for manifest_file in sorted(glob.glob(os.path.join(output_dir, SHARDS_DIR, "*", MANIFEST_FILE))):
+        with open(manifest_file, encoding="utf-8") as f:
+            manifest = json.load(f)
+        manifest["dir"] = os.path.dirname(manifest_file)
+        manifests.append(manifest)
+    return sorted(manifests, key=lambda manifest: manifest["shard"])
+
+
+def check_manifests(manifests: list) -> None:
+    """Raises ValueError unless manifests are of all shards of one run and every cluster is in exactly one shard."""
+    if not manifests:
+        raise ValueError("No shard manifests found, run analysis with --shard i/N first")
+    first = manifests[0]
+    for manifest in manifests[1:]:
+        for key in ("shards", "settings", "files", "clusters_total", "clusters_digest"):
+            if manifest[key] != first[key]:
+                raise ValueError(f"Shard {manifest['dir']} differs from {first['dir']} in {key}, "
+                                 f"remove shard directories of other runs")
+    shards = Counter(manifest["shard"] for manifest in manifests)
+    missing = sorted(set(range(first["shards"])) - set(shards))
+    if missing:
+        raise ValueError(f"Missing results of shards {', '.join(map(str, missing))} of {first['shards']}")
+    clusters = Counter(cluster for manifest in manifests for cluster in manifest["clusters"])
+    repeated = sorted(cluster for cluster, count in clusters.items() if count > 1)
+    if repeated:
+        raise ValueError(f"{len(repeated)} clusters tested in more than one shard, e.g. {', '.join(repeated[:5])}")
+    if len(clusters) != first["clusters_total"]:
+        raise ValueError(f"Shards cover {len(clusters)} of {first['clusters_total']} clusters")
+    if get_clusters_digest(clusters) != first["clusters_digest"]:
+        raise ValueError("Clusters of shards differ from clusters of the input")
+
+
+def merge_shards(output_dir: str, chunk_size: int = 1 << 16) -> dict:
+    """Combines results and s-measure of all shards into files of unsharded run in output_dir.
+
+    Returns manifest of the first shard with number of merged result rows.
+    """
+    manifests = read_manifests(output_dir)
+    check_manifests(manifests)
+    settings, files = manifests[0]["settings"], manifests[0]["files"]
+
+    rows_no = 0
+    if files["results"]:
+        #shard results are sorted by cluster name, merged by name they are in order of unsharded run
+        sink = open_result_sink(os.path.join(output_dir, files["results"]), settings["alpha"],
+                                settings["results_format"])
+        rows = heapq.merge(*(iter_result_file(os.path.join(manifest["dir"], files["results"]))
+                             for manifest in manifests), key=lambda row: row[0])
+        for chunk in iter(lambda: list(itertools.islice(rows, chunk_size)), []):
+            sink.write_rows(chunk)
+        sink.close()
+        rows_no = sink.rows_no
+
+    #clusters with the same s-measure stay in order of cluster names, as in unsharded run
+    s_values = [s_value for manifest in manifests
+                for s_value in read_s_values(os.path.join(manifest["dir"], files["s_values"]))]
+    s_values.sort(key=lambda s_value: s_value[0])
+    s_values.sort(key=lambda s_value: float(s_value[2]), reverse=True)
+    save_s_values(os.path.join(output_dir, files["s_values"]), s_values)
+    return dict(manifests[0], rows_no=rows_no)
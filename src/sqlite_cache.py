@@ -0,0 +1,89 @@
+"""
+GBSC Clusters GO Ontology Functional Analysis Pipeline
+=======================================================
+
+Persistent key-value cache in SQLite file with optional TTL and LRU eviction
+by size, shared by QuickGO responses cache and cluster results cache.
+
+Author: Aleksandra Gruca (2026)
+"""
+
+import sqlite3
+import threading
+import time
+
+
+class SQLiteCache:
+    """Binary values keyed by text, with TTL and LRU eviction by size.
+
+    ttl is given in seconds (None - entries do not expire) and max_size in
+    bytes of stored values.
+    """
+
+    name = "Cache"
+
+    def __init__(self, cache_file: str, ttl: float = None, max_size: int = 1024 ** 3):
+        self.cache_file = cache_file
+        self.ttl = ttl
+        self.max_size = max_size
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._connection = sqlite3.connect(cache_file, check_same_thread=False, isolation_level=None)
+        self._connection.execute("PRAGMA journal_mode=WAL")
+        self._connection.execute(
+            "CREATE TABLE IF NOT EXISTS entries ("
+            "key TEXT PRIMARY KEY, value BLOB, size INTEGER, created REAL, accessed REAL)")
+        self._connection.execute("CREATE INDEX IF NOT EXISTS entries_accessed ON entries (accessed)")
+        self._size = self._connection.execute("SELECT COALESCE(SUM(size), 0) FROM entries").fetchone()[0]
+
+    def get(self, key: str):
+        with self._lock:
+            row = self._connection.execute(
+                "SELECT value, size, created FROM entries WHERE key = ?", (key,)).fetchone()
+            now = time.time()
+            if row is not None and self.ttl is not None and now - row[2] > self.ttl:
+                self._connection.execute("DELETE FROM entries WHERE key = ?", (key,))
+                self._size -= row[1]
+                row = None
+            if row is None:
+                self.misses += 1
+                return None
+            self._connection.execute("UPDATE entries SET accessed = ? WHERE key = ?", (now, key))
+            self.hits += 1
+            return row[0]
+
+    def put(self, key: str, value: bytes) -> None:
+        size = len(value)
+        if size > self.max_size:
+            return
+        with self._lock:
+            now = time.time()
+            old = self._connection.execute("SELECT size FROM entries WHERE key = ?", (key,)).fetchone()
+            self._connection.execute(
+                "INSERT OR REPLACE INTO entries (key, value, size, created, accessed) "
+                "VALUES (?, ?, ?, ?, ?)", (key, value, size, now, now))
+            self._size += size - (old[0] if old else 0)
+            self._evict()
+
+    def _evict(self) -> None:
+        # least recently used entries are removed until cache fits in max_size
+        while self._size > self.max_size:
+            rows = self._connection.execute(
+                "SELECT key, size FROM entries ORDER BY accessed LIMIT 100").fetchall()
+            if not rows:
+                break
+            for key, size in rows:
+                self._connection.execute("DELETE FROM entries WHERE key = ?", (key,))
+                self._size -= size
+                if self._size <= self.max_size:
+                    break
+
+    def report(self) -> str:
+        requests_no = self.hits + self.misses
+        hit_rate = self.hits / requests_no if requests_no else 0.0
+        return (f"{self.name} {self.cache_file}: hits={self.hits} misses={self.misses} "
+                f"hit_rate={hit_rate:.2%} size={self._size / 1024 ** 2:.1f}MB")
+
+    def close(self) -> None:
+        self._connection.close()
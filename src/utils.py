@@ -11,7 +11,22 @@ Original: Joanna Ziemska-Legiecka (2025)
 
 from typing import IO
 from typing import Iterator
+import gzip
+import mmap
 import os
+import tarfile
+
+from src.annotation_store import get_annotation_store_mtime, is_annotation_store
+
+# files of output directory written by 01_download_go.py and 02_gbsc_functional_analysis.py
+GO_ANNOTATIONS_FILE = "go_annotations.json"
+GO_ANNOTATIONS_STORE = "go_annotations_store"
+GO_NAMES_FILE = "go_names.csv"
+ENRICHMENT_RESULTS_FILES = {"tsv": "enrichment_results.csv", "parquet": "enrichment_results.parquet",
+                            "arrow": "enrichment_results.arrow"}
+S_VALUES_FILE = "clusters_s_values.txt"
+# GBSC writes every cluster to <cluster name>.fasta, clusters are named by these files in all input forms
+CLUSTER_FILE_EXTENSION = ".fasta"
 
 class Protein:
     def __init__(self, header="", sequence=""):
@@ -28,18 +43,114 @@ class Protein:
 
 def get_proteins(db_file: IO) -> Iterator[Protein]:
     protein = None
+    sequence = []
     while True:
         line = db_file.readline()
         if not line:
             if protein is not None:
+                protein.sequence = "".join(sequence)
                 yield protein
             break
         if line.startswith(">"):
             if protein is not None:
+                protein.sequence = "".join(sequence)
                 yield protein
             protein = Protein(line.strip())
+            sequence = []
         elif protein is not None:
-            protein.sequence += line.strip()
+            sequence.append(line.strip())
+
+
+def iter_fasta_headers(data) -> Iterator[bytes]:
+    """Yields FASTA header lines (without '>') from bytes or mmap, skipping sequences."""
+    if data[:1] == b">":
+        start = 0
+    else:
+        start = data.find(b"\n>")
+        start = start + 1 if start >= 0 else -1
+    while start >= 0:
+        end = data.find(b"\n", start)
+        if end < 0:
+            end = len(data)
+        yield data[start + 1:end].rstrip(b"\r")
+        start = data.find(b"\n>", end)
+        start = start + 1 if start >= 0 else -1
+
+
+def get_accessions(cluster_file_path: str) -> Iterator[str]:
+    """Accessions (second '|' field of header) of all proteins in FASTA file, read with mmap."""
+    with open(cluster_file_path, "rb") as f:
+        if os.fstat(f.fileno()).st_size == 0:
+            return
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as data:
+            for header in iter_fasta_headers(data):
+                yield header.split(b"|")[1].decode()
+
+
+def read_packed_clusters(clusters_path: str) -> Iterator[tuple]:
+    """Yields (cluster name, accessions) from clusters packed into one file, sorted by cluster name.
+
+    Tar archive (may be compressed) - every regular member is one cluster named
+    by its file name. Multi-cluster FASTA file - proteins are grouped by the
+    last '|' field of header, which GBSC sets to cluster name, and clusters are
+    named as GBSC cluster files (<cluster name>.fasta), so names, and shards,
+    are the same as for clusters directory or tar archive.
+    """
+    if tarfile.is_tarfile(clusters_path):
+        clusters = []
+        with tarfile.open(clusters_path) as tar:
+            for member in tar:
+                if member.isfile():
+                    data = tar.extractfile(member).read()
+                    clusters.append((os.path.basename(member.name),
+                                     [i.split(b"|")[1].decode() for i in iter_fasta_headers(data)]))
+        yield from sorted(clusters)
+        return
+    clusters = {}
+    with open(clusters_path, "rb") as f:
+        if os.fstat(f.fileno()).st_size == 0:
+            return
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as data:
+            for header in iter_fasta_headers(data):
+                fields = header.split(b"|")
+                clusters.setdefault(fields[-1].decode().strip(), []).append(fields[1].decode())
+    for cluster_name in sorted(clusters):
+        yield f"{cluster_name}{CLUSTER_FILE_EXTENSION}", clusters[cluster_name]
+
+
+def read_clusters(clusters) -> dict:
+    """Cluster name -> accessions of clusters directory, tar archive or multi-cluster FASTA file (or dict)."""
+    if isinstance(clusters, dict):
+        return clusters
+    if os.path.isdir(clusters):
+        return {file: list(get_accessions(os.path.join(clusters, file))) for file in sorted(os.listdir(clusters))}
+    return dict(read_packed_clusters(clusters))
+
+
+def get_aspect_dir(output_dir: str, aspect: str) -> str:
+    #01_download_go.py --aspect=all writes files of every aspect to its own subdirectory, e.g. output/F
+    return os.path.join(output_dir, aspect)
+
+
+def get_annotations_file(output_dir: str) -> str:
+    #binary store is used unless JSON file is newer (e.g. written by later run with --annotation_format=json),
+    #the JSON path is returned when there is no store, even if the file does not exist
+    go_annotations_file_path = os.path.join(output_dir, GO_ANNOTATIONS_FILE)
+    go_annotations_store_path = os.path.join(output_dir, GO_ANNOTATIONS_STORE)
+    if is_annotation_store(go_annotations_store_path) and (
+            not os.path.exists(go_annotations_file_path)
+            or get_annotation_store_mtime(go_annotations_store_path) >= os.path.getmtime(go_annotations_file_path)):
+        return go_annotations_store_path
+    return go_annotations_file_path
+
+
+def open_text_file(file: str) -> IO:
+    #gzip compressed files are recognised by magic number, not by extension
+    with open(file, "rb") as f:
+        compressed = f.read(2) == b"\x1f\x8b"
+    if compressed:
+        return gzip.open(file, "rt", encoding="utf-8")
+    return open(file, "r", encoding="utf-8")
 
 
 def get_all_gbsc_proteins(gbsc_clusters_path):
@@ -47,8 +158,7 @@ def get_all_gbsc_proteins(gbsc_clusters_path):
     all_gbsc_proteins = []
     for cluster_file in files:
         cluster_file_path = os.path.join(gbsc_clusters_path, cluster_file)
-        proteins = get_proteins(open(cluster_file_path))
-        all_gbsc_proteins.extend([i.get_acc() for i in proteins])
+        all_gbsc_proteins.extend(get_accessions(cluster_file_path))
 
     all_gbsc_proteins_uniqe = list(set(all_gbsc_proteins))
     with open('gbsc_test_protein_IDs.txt', 'w') as f: